@@ -1,14 +1,24 @@
 import streamlit as st
-import pandas as pd
+import logging
 from datetime import date, datetime
 from src.models import Trip
-from src.manager import TripManager
+from src.storage import SQLITE_SUFFIXES, TripConflictError, TripPage, open_storage
+from src.search import TripSearchIndex
+from src.attachments import AttachmentCache
+from src.thumbnails import THUMBNAIL_DIRNAME, ThumbnailCache
+from src.watcher import TripWatcher
+from src import instrumentation
 import os
 import shutil
 from pathlib import Path
-from collections import Counter
 import random
-import pydeck as pdk
+# pandas and pydeck dominate a cold start, so only the pages that use them import them
+
+logging.basicConfig(level=logging.INFO)
+
+# Per-rerun timings for the profiling panel (TRAVELLOG_PROFILE=1); no-ops otherwise
+rerun_profile = instrumentation.snapshot() if instrumentation.enabled else None
+sections = instrumentation.stopwatch("app")
 
 # Page Configuration
 st.set_page_config(
@@ -56,32 +66,49 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize Manager
+# Initialize Manager (kept across reruns so its scan cache survives)
 BASE_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trips_data")
-manager = TripManager(BASE_DATA_DIR)
-
-# Country Coordinates for Map
-COUNTRY_COORDS = {
-    "China": [35.8617, 104.1954],
-    "United States of America": [37.0902, -95.7129],
-    "Switzerland": [46.8182, 8.2275],
-    "Hungary": [47.1625, 19.5033],
-    "United Arab Emirates": [23.4241, 53.8478],
-    "Iceland": [64.9631, -19.0208],
-    "Austria": [47.5162, 14.5501],
-    "Norway": [60.4720, 8.4689],
-    "France": [46.2276, 2.2137],
-    "Germany, Federal Republic Of": [51.1657, 10.4515],
-    "Japan": [36.2048, 138.2529],
-    "Indonesia": [-0.7893, 113.9213],
-    "United Kingdom": [55.3781, -3.4360],
-    "Australia": [-25.2744, 133.7751],
-    "Italy": [41.8719, 12.5674],
-    "Spain": [40.4637, -3.7492],
-    "Canada": [56.1304, -106.3468],
-}
-# Fallback for unknown countries
-DEFAULT_COORD = [0.0, 0.0]
+
+@st.cache_resource
+def get_manager():
+    # TRAVELLOG_STORAGE may point at a SQLite file (e.g. trips_data/trips.db) instead of the folder store
+    location = os.environ.get("TRAVELLOG_STORAGE", BASE_DATA_DIR)
+    if location.endswith(SQLITE_SUFFIXES):
+        return open_storage(location)
+    # Raise on network shares (NFS/SMB) where metadata reads are latency bound
+    scan_workers = int(os.environ.get("TRAVELLOG_SCAN_WORKERS", "1"))
+    storage = open_storage(location, scan_workers=scan_workers)
+    # Pick up trips edited outside the app; set TRAVELLOG_WATCH=0 to rescan on every load instead
+    if os.environ.get("TRAVELLOG_WATCH", "1") != "0":
+        TripWatcher(storage, poll_interval=float(os.environ.get("TRAVELLOG_POLL_INTERVAL", "2"))).start()
+    return storage
+
+@st.cache_resource
+def get_attachment_cache():
+    return AttachmentCache()
+
+@st.cache_resource
+def get_thumbnail_cache():
+    return ThumbnailCache(manager.base_path / THUMBNAIL_DIRNAME)
+
+@st.cache_resource
+def get_search_index():
+    # Built once, then kept current by the manager's change events
+    index = TripSearchIndex(manager.scan_trips(use_cache=True))
+    manager.subscribe(index.handle_event)
+    return index
+
+@st.cache_resource
+def get_gazetteer():
+    # The data file is memory-mapped on the first lookup, on the Analytics page
+    from src.gazetteer import Gazetteer
+    return Gazetteer()
+
+manager = get_manager()
+sections.lap("setup")
+
+# Trips rendered per Travel History page
+HISTORY_PAGE_SIZE = 20
 
 # Sidebar Navigation
 with st.sidebar:
@@ -93,39 +120,59 @@ with st.sidebar:
     st.info("Manage your international travel history with ease.")
 
 # Helper to calculate stats
-def get_stats(trips):
-    total_trips = len(trips)
-    countries = set(t.country for t in trips)
-    total_countries = len(countries)
-    
-    total_days = 0
-    for t in trips:
-        try:
-            # Parse dates (handle YYYY-MM and YYYY-MM-DD)
-            d1 = datetime.strptime(t.start_date, "%Y-%m-%d") if len(t.start_date) == 10 else datetime.strptime(t.start_date, "%Y-%m")
-            d2 = datetime.strptime(t.end_date, "%Y-%m-%d") if len(t.end_date) == 10 else datetime.strptime(t.end_date, "%Y-%m")
-            duration = (d2 - d1).days
-            total_days += max(0, duration)
-        except Exception as e:
-            pass
-        
-    return total_trips, total_countries, total_days
+def get_trip_frame(trips):
+    """Columnar view of the trips, rebuilt only when the cached scan result changes."""
+    from src import stats
+    generation = manager.generation
+    cached = st.session_state.get("trip_frame")
+    if cached is None or cached[0] != generation:
+        cached = (generation, stats.trips_to_frame(trips))
+        st.session_state.trip_frame = cached
+    return cached[1]
+
+def get_stats():
+    """Stats row totals. Counts come from the aggregates; days traveled are computed from the
+    trip frame only after the trips changed, and kept with the aggregates across restarts."""
+    aggregates = manager.aggregates
+    days = aggregates.known_days_traveled()
+    if days is None:
+        from src import stats
+        fingerprint = aggregates.fingerprint
+        _, _, days = stats.summarize(get_trip_frame(manager.scan_trips(use_cache=True)))
+        aggregates.record_days_traveled(fingerprint, days)
+    return sum(aggregates.countries.values()), len(aggregates.countries), days
+
+def get_travel_calendar(trips):
+    """Overlap-aware day counts for residency questions, rebuilt with the trip frame."""
+    generation = manager.generation
+    cached = st.session_state.get("travel_calendar")
+    if cached is None or cached[0] != generation:
+        from src import stats
+        cached = (generation, stats.travel_calendar(get_trip_frame(trips)))
+        st.session_state.travel_calendar = cached
+    return cached[1]
 
 # Session State for Editing
 if "editing_trip" not in st.session_state:
     st.session_state.editing_trip = None
 
+# Set when an edit or delete lost a race with another session
+conflict = st.session_state.pop("edit_conflict", None)
+if conflict:
+    st.warning(conflict)
+
 # --- Page: Travel History ---
 if page == "Travel History" and st.session_state.editing_trip is None:
     st.title("🌎 Travel History")
     
-    trips = manager.scan_trips()
+    # Totals and filter options come from the aggregates; query_page reads only the trips shown
+    country_counts = dict(manager.aggregates.countries)
     
-    if not trips:
+    if not country_counts:
         st.info("No trips recorded yet. Go to 'Add New Trip' to start your journey!")
     else:
         # Stats Row
-        t_count, c_count, d_count = get_stats(trips)
+        t_count, c_count, d_count = get_stats()
         
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -134,11 +181,49 @@ if page == "Travel History" and st.session_state.editing_trip is None:
             st.metric("Countries Visited", c_count)
         with col3:
             st.metric("Total Days Traveled", d_count)
+        sections.lap("history.stats")
             
         st.markdown("### Recent Adventures")
         
+        # Search / filter bar, answered from the in-memory search index
+        search_index = get_search_index()
+        f_text, f_tags, f_countries, f_dates = st.columns([3, 2, 2, 2])
+        with f_text:
+            search_text = st.text_input("Search notes", placeholder="e.g. ramen")
+        with f_tags:
+            tag_filter = st.multiselect("Tags", search_index.tags())
+        with f_countries:
+            country_filter = st.multiselect("Countries", sorted(country_counts),
+                                            format_func=lambda c: f"{c} ({country_counts.get(c, 0)})")
+        with f_dates:
+            date_filter = st.date_input("Started between", value=[])
+
+        date_bounds = (None, None)
+        if isinstance(date_filter, (list, tuple)) and len(date_filter) == 2:
+            date_bounds = (date_filter[0].toordinal(), date_filter[1].toordinal())
+        filters = (search_text, tuple(tag_filter), tuple(country_filter), date_bounds)
+
+        # Only one page of trips is loaded and rendered per rerun
+        if "history_offset" not in st.session_state or st.session_state.get("history_filters") != filters:
+            st.session_state.history_offset = 0
+            st.session_state.history_filters = filters
+        offset = st.session_state.history_offset
+        if any([search_text, tag_filter, country_filter, date_bounds[0] is not None]):
+            matches = search_index.search(search_text, tag_filter, country_filter, *date_bounds)
+            page_trips = matches[offset:offset + HISTORY_PAGE_SIZE]
+            more = page_trips and offset + len(page_trips) < len(matches)
+            next_cursor = (page_trips[-1].start_date, page_trips[-1].id) if more else None
+            history_page = TripPage(page_trips, len(matches), offset, next_cursor)
+        else:
+            history_page = manager.query_page(limit=HISTORY_PAGE_SIZE, offset=offset)
+        sections.lap("history.query")
+        if not history_page.trips and history_page.offset > 0:
+            # The last page emptied (e.g. after a delete); step back
+            st.session_state.history_offset = max(0, history_page.offset - HISTORY_PAGE_SIZE)
+            st.rerun()
+        
         # Display Trips
-        for trip in trips:
+        for trip in history_page.trips:
             # Show YYYY-MM for the title (works for both YYYY-MM-DD and YYYY-MM strings)
             display_date = trip.start_date[:7]
             with st.expander(f"{display_date} | {trip.city}, {trip.country}", expanded=False):
@@ -151,18 +236,26 @@ if page == "Travel History" and st.session_state.editing_trip is None:
                         st.markdown(f"**Tags:** " + "".join([f"`{t}` " for t in trip.tags]))
                     
                     if trip.attachments:
-                        st.write("**Attachments:**")
-                        for att in trip.attachments:
-                            att_path = manager.get_attachment_path(trip, att)
-                            if att_path.exists():
-                                with open(att_path, "rb") as f:
-                                    st.download_button(
-                                        label=f"📄 {att}",
-                                        data=f.read(),
-                                        file_name=att,
-                                        key=f"{trip.id}_{att}",
-                                        use_container_width=True
+                        # Expander bodies run even when collapsed, so attachment bytes are
+                        # only read once the user asks for them.
+                        if st.toggle(f"**Attachments** ({len(trip.attachments)})", key=f"att_{trip.id}"):
+                            attachment_cache = get_attachment_cache()
+                            for att in trip.attachments:
+                                # Archived trips stream their attachments out of the archive file
+                                try:
+                                    data = attachment_cache.read_from(
+                                        manager.attachment_key(trip, att),
+                                        lambda: manager.open_attachment(trip, att)
                                     )
+                                except FileNotFoundError:
+                                    continue
+                                st.download_button(
+                                    label=f"📄 {att}",
+                                    data=data,
+                                    file_name=att,
+                                    key=f"{trip.id}_{att}",
+                                    use_container_width=True
+                                )
                 
                 with col_actions:
                     if st.button("Edit", key=f"edit_{trip.id}", use_container_width=True):
@@ -170,38 +263,76 @@ if page == "Travel History" and st.session_state.editing_trip is None:
                         st.rerun()
                     
                     if st.button("Delete", key=f"del_{trip.id}", use_container_width=True):
-                        if manager.delete_trip(trip.id):
+                        try:
+                            deleted = manager.delete_trip(trip.id, expected_version=trip.version)
+                        except TripConflictError:
+                            st.session_state.edit_conflict = (
+                                f"The trip to {trip.city} was changed by someone else after this page was loaded, "
+                                "so it was not deleted. Check the latest version before deleting it.")
+                            st.rerun()
+                        if deleted:
                             st.success("Trip deleted!")
                             st.rerun()
                         else:
                             st.error("Failed to delete trip.")
+        sections.lap("history.trips")
+
+        # Page navigation
+        first = history_page.offset + 1
+        last = history_page.offset + len(history_page.trips)
+        nav_prev, nav_info, nav_next = st.columns([1, 3, 1])
+        with nav_prev:
+            if st.button("← Previous", disabled=history_page.offset == 0, use_container_width=True):
+                st.session_state.history_offset = max(0, history_page.offset - HISTORY_PAGE_SIZE)
+                st.rerun()
+        with nav_info:
+            if history_page.total:
+                st.caption(f"Showing {first}–{last} of {history_page.total} trips")
+            else:
+                st.caption("No trips match these filters.")
+        with nav_next:
+            if st.button("Next →", disabled=history_page.next_cursor is None, use_container_width=True):
+                st.session_state.history_offset = history_page.offset + HISTORY_PAGE_SIZE
+                st.rerun()
 
 # --- Page: Analytics ---
 elif page == "Analytics":
+    import pandas as pd
+    import pydeck as pdk
+
     st.title("📊 Travel Analytics")
     
-    trips = manager.scan_trips()
-    if not trips:
+    # Rendered from the materialized aggregates; no trips are scanned here
+    aggregates = manager.aggregates
+    if not aggregates.countries:
          st.info("No trips data available yet.")
     else:
         # 1. Global Footprint Map
         st.subheader("🌍 Global Footprint")
         
-        # Aggregate data for map
-        country_counts = Counter([t.country for t in trips])
+        gazetteer = get_gazetteer()
+        map_level = st.radio("Show", ["Countries", "Cities"], horizontal=True, label_visibility="collapsed")
+        country_counts = aggregates.top_countries(len(aggregates.countries))
         map_data = []
-        
-        for country, count in country_counts.items():
-            coords = COUNTRY_COORDS.get(country, DEFAULT_COORD)
-            if coords != DEFAULT_COORD:
-                map_data.append({
-                    "lat": coords[0],
-                    "lon": coords[1],
-                    "country": country,
-                    "visits": count,
-                    "label": str(count)
-                })
-        
+        unplaced = []
+
+        if map_level == "Countries":
+            places = [(country, gazetteer.country(country), count) for country, count in country_counts]
+        else:
+            places = [(f"{city}, {country}", gazetteer.city(city, country), count)
+                      for city, country, count in aggregates.top_cities(sum(map(len, aggregates.cities.values())))]
+        for name, place, count in places:
+            if place is None:
+                unplaced.append(name)
+                continue
+            map_data.append({
+                "lat": place.lat,
+                "lon": place.lon,
+                "place": name,
+                "visits": count,
+                "label": str(count)
+            })
+
         if map_data:
             df_map = pd.DataFrame(map_data)
             
@@ -220,7 +351,7 @@ elif page == "Analytics":
                         data=df_map,
                         get_position='[lon, lat]',
                         get_color='[31, 119, 180, 160]',
-                        get_radius=200000,
+                        get_radius=200000 if map_level == "Countries" else 40000,
                         pickable=True,
                     ),
                     pdk.Layer(
@@ -233,17 +364,28 @@ elif page == "Analytics":
                         get_alignment_baseline="'center'",
                     ),
                 ],
-                tooltip={"text": "{country}: {visits} visits"}
+                tooltip={"text": "{place}: {visits} visits"}
             ))
         else:
             st.warning("No map data available.")
+        if unplaced:
+            more = f" and {len(unplaced) - 20} more" if len(unplaced) > 20 else ""
+            st.caption(f"Not on the map (unknown location): {', '.join(sorted(unplaced)[:20])}{more}")
+
+        st.markdown("---")
+
+        # Trips per year
+        st.subheader("📅 Trips per Year")
+        yearly = pd.Series({year: totals["trips"] for year, totals in aggregates.years.items()}).sort_index()
+        st.bar_chart(yearly)
+        sections.lap("analytics.map_and_years")
 
         st.markdown("---")
 
         # 2. Top 3 Visited Countries
         st.subheader("🏆 Top 3 Destinations")
         
-        top_3 = country_counts.most_common(3)
+        top_3 = country_counts[:3]
         
         cols = st.columns(3)
         
@@ -258,25 +400,69 @@ elif page == "Analytics":
                 """, unsafe_allow_html=True)
                 
                 # Find an image for this country
-                country_image = None
+                thumbnail = None
                 
-                # Look for ANY trip to this country with an image
-                relevant_trips = [t for t in trips if t.country == country]
-                for t in relevant_trips:
-                    if t.attachments:
-                        # Check extensions
-                        images = [att for att in t.attachments if att.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))]
-                        if images:
-                            # Pick random valid image
-                            img_name = random.choice(images)
-                            country_image = manager.get_attachment_path(t, img_name)
-                            break # Found one
+                # Pick a random photo among this country's image attachments
+                candidates = aggregates.images.get(country)
+                if candidates:
+                    trip_id, img_name, image_digest = random.choice(candidates)
+                    t = manager.get_trip_by_id(trip_id)
+                    if t:
+                        try:
+                            key = manager.attachment_key(t, img_name)  # raises if the photo is gone
+                            # Serve a cached downscaled copy instead of the full-resolution photo
+                            thumbnail = get_thumbnail_cache().get(
+                                manager.get_attachment_path(t, img_name), digest=image_digest,
+                                opener=lambda: manager.open_attachment(t, img_name), key=key
+                            )
+                        except FileNotFoundError:
+                            pass
                 
-                if country_image and country_image.exists():
-                    st.image(str(country_image), use_container_width=True)
+                if thumbnail is not None and thumbnail.exists():
+                    st.image(str(thumbnail), use_container_width=True)
                 else:
                     # Placeholder if no image found
                     st.info("No photos uploaded yet.")
+        sections.lap("analytics.top_destinations")
+
+        st.markdown("---")
+
+        # 3. Residency: distinct days abroad, overlapping trips counted once
+        st.subheader("🧳 Days Abroad & Residency")
+        # Needs every trip's dates, so it is only computed on request
+        if st.toggle("Show residency calculator"):
+            calendar = get_travel_calendar(manager.scan_trips(use_cache=True))
+            r_country, r_window, r_year = st.columns(3)
+            with r_country:
+                residency_country = st.selectbox("Country", ["All countries"] + sorted(calendar.by_country))
+            with r_window:
+                window = st.number_input("Rolling window (days)", min_value=1, max_value=3650, value=180)
+            with r_year:
+                year_start = st.date_input("Tax year starts on", value=date(2000, 1, 1), format="MM/DD/YYYY")
+            country = None if residency_country == "All countries" else residency_country
+            window = int(window)
+
+            today = date.today().toordinal()
+            busiest, busiest_end = calendar.max_rolling(window, country)
+            m1, m2, m3 = st.columns(3)
+            with m1:
+                st.metric("Distinct Travel Days", calendar.days(country=country))
+            with m2:
+                st.metric(f"Last {window} Days", calendar.rolling(window, today, country))
+            with m3:
+                st.metric(f"Most in Any {window} Days", busiest)
+            if busiest_end is not None:
+                busiest_start = date.fromordinal(busiest_end - window + 1)
+                st.caption(f"Busiest window: {busiest_start} to {date.fromordinal(busiest_end)}")
+
+            per_period = calendar.per_period((year_start.month, year_start.day), country)
+            if per_period:
+                label = "Year" if (year_start.month, year_start.day) == (1, 1) else "Tax year starting"
+                st.bar_chart(pd.Series(per_period, name="Days").rename_axis(label))
+            sections.lap("analytics.residency")
+            if calendar.approximate_trips:
+                st.caption(f"{calendar.approximate_trips} trips only have a month; they are counted as spanning "
+                           f"whole months, which accounts for up to {calendar.uncertain_days()} of all travel days.")
 
 # --- Page: Add/Edit Trip ---
 elif page == "Add New Trip" or st.session_state.editing_trip is not None:
@@ -382,15 +568,29 @@ elif page == "Add New Trip" or st.session_state.editing_trip is not None:
                         country=country,
                         notes=notes,
                         tags=tags,
-                        attachments=current_trip.attachments
+                        attachments=list(current_trip.attachments),
+                        blobs=dict(current_trip.blobs),
+                        version=current_trip.version
                     )
                     
-                    success = manager.save_trip(updated_trip, uploaded_files)
+                    try:
+                        success = manager.save_trip(updated_trip, uploaded_files)
+                    except TripConflictError as e:
+                        # Someone saved or deleted this trip after the form was opened; start over from theirs
+                        latest = manager.get_trip_by_id(e.trip_id)
+                        st.session_state.editing_trip = latest
+                        st.session_state.edit_conflict = (
+                            "This trip was deleted by someone else while you were editing it." if latest is None else
+                            "This trip was changed by someone else while you were editing it. "
+                            "The form now shows their version; please apply your changes again.")
+                        st.rerun()
                     
                     if success:
                         st.success("Trip updated successfully!")
                         st.session_state.editing_trip = None
                         st.rerun()
+                    else:
+                        st.error("Something went wrong while updating the trip.")
                 else:
                     new_trip = Trip(
                         start_date=start_val,
@@ -407,3 +607,16 @@ elif page == "Add New Trip" or st.session_state.editing_trip is not None:
                         st.balloons()
                     else:
                         st.error("Something went wrong while saving the trip.")
+
+# --- Profiling panel ---
+if instrumentation.enabled:
+    sections.lap("rest_of_page")
+    report = instrumentation.since(rerun_profile)
+    instrumentation.log_report("rerun", report, page=page)
+    with st.sidebar:
+        with st.expander("⏱️ Profile (last rerun)"):
+            st.caption(f"{report['wall_ms']:.1f} ms in total, including work done by other sessions meanwhile")
+            spans = sorted(report["spans"].items(), key=lambda item: item[1]["ms"], reverse=True)
+            st.table([{"section": name, "calls": totals["calls"], "ms": totals["ms"]} for name, totals in spans])
+            if report["counters"]:
+                st.table([{"counter": name, "value": value} for name, value in sorted(report["counters"].items())])
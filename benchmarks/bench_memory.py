@@ -0,0 +1,68 @@
+"""Compares the memory footprint of Trip and CompactTrip over a synthetic history.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory --trips 1000000
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+
+from src.models import CompactTrip, Trip
+
+COUNTRIES = [f"Country {i}" for i in range(200)]
+CITIES = [f"City {i}" for i in range(2000)]
+TAGS = ["business", "family", "solo", "holiday", "conference", "food", "hiking", "winter", "summer", "roadtrip"]
+
+
+def synthetic_records(count: int, seed: int = 0):
+    """Yields metadata dicts shaped like freshly decoded metadata.json files.
+
+    Strings are rebuilt per record (as json.load would) rather than shared.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        year = rng.randint(1995, 2025)
+        month = rng.randint(1, 12)
+        if rng.random() < 0.5:
+            start = f"{year}-{month:02d}-{rng.randint(1, 28):02d}"
+            end = f"{year}-{month:02d}-{rng.randint(1, 28):02d}"
+        else:
+            start = end = f"{year}-{month:02d}"
+        yield {
+            "id": f"{i:08x}-0000-4000-8000-{rng.getrandbits(48):012x}",
+            "start_date": start,
+            "end_date": end,
+            "city": "".join(rng.choice(CITIES)),
+            "country": "".join(rng.choice(COUNTRIES)),
+            "notes": "",
+            "tags": ["".join(t) for t in rng.sample(TAGS, rng.randint(0, 3))],
+            "attachments": [],
+        }
+
+
+def measure(cls, count: int):
+    """Returns the bytes still allocated after building count instances of cls."""
+    gc.collect()
+    tracemalloc.start()
+    trips = [cls.from_dict(record) for record in synthetic_records(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del trips
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trips", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"{'class':>12} {'MiB':>10} {'bytes/trip':>11}")
+    for cls in (Trip, CompactTrip):
+        size = measure(cls, args.trips)
+        print(f"{cls.__name__:>12} {size / 2**20:>10.1f} {size / args.trips:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
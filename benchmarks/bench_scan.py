@@ -0,0 +1,70 @@
+"""Measures how TripManager.scan_trips scales with the number of loader threads.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_scan --trips 5000
+    python -m benchmarks.bench_scan --path /mnt/nas/trips_data   # an existing (e.g. network) store
+
+Thread counts only pay off when opening a file has real latency (NFS/SMB);
+on a local SSD the JSON decoding dominates and the curve stays flat.
+"""
+import argparse
+import json
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from src.manager import TripManager
+
+
+def make_store(path: Path, count: int):
+    """Writes count minimal trip folders into path."""
+    for i in range(count):
+        trip_id = str(uuid.uuid4())
+        folder = path / f"{2000 + i % 25}-{i % 12 + 1:02d}_City{i}_Country{i % 50}"
+        folder.mkdir()
+        with open(folder / "metadata.json", 'w') as f:
+            json.dump({
+                "id": trip_id,
+                "start_date": f"{2000 + i % 25}-{i % 12 + 1:02d}",
+                "end_date": f"{2000 + i % 25}-{i % 12 + 1:02d}",
+                "city": f"City{i}",
+                "country": f"Country{i % 50}",
+                "notes": "",
+                "tags": ["bench"],
+                "attachments": [],
+            }, f, indent=2)
+
+
+def run(path: Path, worker_counts, repeat: int):
+    manager = TripManager(str(path))
+    print(f"{'workers':>8} {'best (s)':>10} {'trips/s':>10}")
+    for workers in worker_counts:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            trips = manager.scan_trips(workers=workers)
+            best = min(best, time.perf_counter() - start)
+        print(f"{workers:>8} {best:>10.4f} {len(trips) / best:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", help="Existing trips_data directory to scan (default: generate one)")
+    parser.add_argument("--trips", type=int, default=2000, help="Trips to generate when --path is not given")
+    parser.add_argument("--workers", default="1,2,4,8,16", help="Comma separated thread counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    worker_counts = [int(w) for w in args.workers.split(",")]
+    if args.path:
+        run(Path(args.path), worker_counts, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            make_store(Path(tmp), args.trips)
+            run(Path(tmp), worker_counts, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
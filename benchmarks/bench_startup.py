@@ -0,0 +1,101 @@
+"""Measures how long app.py takes to bring up its first page, and what each page imports.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --data /tmp/trips_10k --repeat 10 --output startup.json
+
+Every repetition starts a fresh interpreter and renders the app headlessly
+with Streamlit's AppTest: first the default page (a cold start, including
+imports), then each other page in turn. The data directory is copied to a
+temporary location first, so the app's index files are never written into it.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PAGES = ["Travel History", "Analytics", "Add New Trip"]
+HEAVY_MODULES = ["numpy", "pandas", "pydeck", "PIL"]
+
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_ms = (time.perf_counter() - start) * 1000
+
+app, pages, heavy = sys.argv[1], json.loads(sys.argv[2]), json.loads(sys.argv[3])
+at = AppTest.from_file(app, default_timeout=600)
+steps = []
+for i, page in enumerate(pages):
+    before = time.perf_counter()
+    if i == 0:
+        at.run()
+    else:
+        at.sidebar.radio[0].set_value(page).run()
+    if at.exception:
+        raise SystemExit(f"{page}: {at.exception[0].value}")
+    steps.append({"page": page, "ms": (time.perf_counter() - before) * 1000,
+                  "modules": [m for m in heavy if m in sys.modules]})
+print(json.dumps({"streamlit_import_ms": streamlit_ms, "steps": steps}))
+"""
+
+
+def measure(app: Path, data: str) -> dict:
+    env = dict(os.environ, TRAVELLOG_STORAGE=data)
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, str(app), json.dumps(PAGES), json.dumps(HEAVY_MODULES)],
+        cwd=app.parent, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=str(REPO_ROOT / "app.py"))
+    parser.add_argument("--data", default=str(REPO_ROOT / "trips_data_example"),
+                        help="Trips directory or SQLite file to start the app on (copied first)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(args.data)
+        if source.is_dir():
+            data = str(Path(tmp) / "trips_data")
+            shutil.copytree(source, data)
+        else:
+            data = str(Path(tmp) / source.name)
+            shutil.copy2(source, data)
+        runs = [measure(Path(args.app).resolve(), data) for _ in range(args.repeat)]
+
+    summary = {
+        "streamlit_import_ms": statistics.median(run["streamlit_import_ms"] for run in runs),
+        "pages": [
+            {
+                "page": page,
+                "first_visit_ms": statistics.median(run["steps"][i]["ms"] for run in runs),
+                "modules_loaded": runs[-1]["steps"][i]["modules"],
+            }
+            for i, page in enumerate(PAGES)
+        ],
+    }
+    print(f"streamlit import: {summary['streamlit_import_ms']:.0f} ms (median of {args.repeat})")
+    print(f"{'page':<24} {'first visit (ms)':>17}  heavy modules loaded so far")
+    for i, page in enumerate(summary["pages"]):
+        label = f"{page['page']}{' (cold)' if i == 0 else ''}"
+        print(f"{label:<24} {page['first_visit_ms']:>17.0f}  {', '.join(page['modules_loaded']) or '-'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"app": args.app, "data": args.data, "repeat": args.repeat, "runs": runs, **summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
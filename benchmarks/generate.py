@@ -0,0 +1,219 @@
+"""Generates reproducible synthetic trip stores for benchmarking.
+
+Run from the repository root:
+
+    python -m benchmarks.generate /tmp/trips_10k --trips 10000
+    python -m benchmarks.generate /tmp/trips_1m.db --trips 1000000 --attachment-rate 0
+    python -m benchmarks.generate /tmp/skewed --trips 50000 --countries 200 --country-skew 1.3 --tags 500
+
+The same arguments and --seed always produce the same trips. Countries and
+tags are drawn from Zipf-like distributions (weight 1/rank**skew), so a few
+are very common and most are rare, as in a real travel history. Attachments
+are stored in the blob store and their contents are drawn from a small pool,
+which keeps large stores cheap on disk.
+"""
+import argparse
+import io
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import date
+from itertools import accumulate
+from pathlib import Path
+from typing import Iterator, List
+
+from src.blobs import BLOB_DIRNAME, BlobStore
+from src.layout import ID_LAYOUT, LAYOUTS, NAME_LAYOUT, AliasView, readable_name, write_layout
+from src.models import Trip
+from src.storage import SQLITE_SUFFIXES, open_storage
+
+FIRST_DAY = date(2000, 1, 1).toordinal()
+LAST_DAY = date(2025, 12, 31).toordinal()
+NOTE_WORDS = ["museum", "beach", "ramen", "hiking", "conference", "family", "wedding", "train", "ferry",
+              "snow", "market", "castle", "sunset", "festival", "roadtrip", "diving", "wine", "temple"]
+ATTACHMENT_KINDS = ["photo{}.jpg", "ticket{}.pdf", "visa{}.png", "boarding_pass{}.pdf", "receipt{}.jpg"]
+
+
+@dataclass
+class GeneratorConfig:
+    trips: int = 1000
+    seed: int = 0
+    countries: int = 100
+    country_skew: float = 1.1
+    cities_per_country: int = 20
+    tags: int = 50
+    tag_skew: float = 1.0
+    tags_per_trip: float = 2.0
+    attachment_rate: float = 0.3
+    attachments_per_trip: float = 2.0
+    attachment_kb: int = 64
+    attachment_pool: int = 16
+    month_rate: float = 0.2
+    mean_days: float = 7.0
+    note_words: int = 8
+    layout: str = NAME_LAYOUT  # trip folder naming for filesystem stores, see src.layout
+
+
+def _zipf_cum_weights(count: int, skew: float) -> List[float]:
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    # Knuth's method; means here are small
+    limit, k, p = math.exp(-mean), 0, rng.random()
+    while p > limit:
+        k += 1
+        p *= rng.random()
+    return k
+
+
+def generate_trips(config: GeneratorConfig) -> Iterator[Trip]:
+    """Yields config.trips synthetic trips; attachment names are set but blobs are not."""
+    rng = random.Random(config.seed)
+    countries = [f"Country{i:03d}" for i in range(config.countries)]
+    tags = [f"tag{i:03d}" for i in range(config.tags)]
+    country_weights = _zipf_cum_weights(len(countries), config.country_skew)
+    tag_weights = _zipf_cum_weights(len(tags), config.tag_skew)
+
+    for _ in range(config.trips):
+        start = rng.randint(FIRST_DAY, LAST_DAY)
+        end = start + int(rng.expovariate(1 / config.mean_days)) if config.mean_days > 0 else start
+        start_date, end_date = date.fromordinal(start).isoformat(), date.fromordinal(end).isoformat()
+        if rng.random() < config.month_rate:
+            start_date, end_date = start_date[:7], end_date[:7]
+
+        country = rng.choices(countries, cum_weights=country_weights)[0]
+        city = f"{country}-City{rng.randrange(config.cities_per_country):02d}"
+        trip_tags = sorted(set(rng.choices(tags, cum_weights=tag_weights, k=_poisson(rng, config.tags_per_trip)))) \
+            if tags else []
+        attachments = []
+        if rng.random() < config.attachment_rate:
+            for i in range(max(1, _poisson(rng, config.attachments_per_trip))):
+                attachments.append(rng.choice(ATTACHMENT_KINDS).format(i))
+        notes = " ".join(rng.choices(NOTE_WORDS, k=rng.randint(0, config.note_words)))
+
+        yield Trip(start_date, end_date, city, country, notes=notes, tags=trip_tags,
+                   attachments=sorted(set(attachments)), id=str(uuid.UUID(int=rng.getrandbits(128), version=4)))
+
+
+def _attachment_pool(blobs: BlobStore, config: GeneratorConfig) -> List[str]:
+    """Puts config.attachment_pool distinct payloads into the blob store and returns their digests."""
+    rng = random.Random(config.seed + 1)
+    digests = []
+    for _ in range(config.attachment_pool):
+        digest, _ = blobs.put(io.BytesIO(rng.randbytes(config.attachment_kb * 1024)))
+        digests.append(digest)
+    return digests
+
+
+def write_store(location: str, config: GeneratorConfig, batch_size: int = 2000) -> int:
+    """Writes a synthetic store at location (a directory, or a SQLite file). Returns the trip count.
+
+    Filesystem stores are written folder by folder, as the app lays them
+    out, and indexed when first opened; SQLite stores go through save_trips.
+    """
+    path = Path(location)
+    sqlite = location.endswith(SQLITE_SUFFIXES)
+    base = path.parent if sqlite else path
+    base.mkdir(parents=True, exist_ok=True)
+    blobs = BlobStore(base / BLOB_DIRNAME)
+    pool = _attachment_pool(blobs, config) if config.attachment_rate > 0 and config.attachment_pool > 0 else []
+    rng = random.Random(config.seed + 2)
+
+    storage = open_storage(location) if sqlite else None
+    by_id = config.layout == ID_LAYOUT and not sqlite
+    if by_id:
+        write_layout(path, ID_LAYOUT)
+        aliases = AliasView(path)
+    used_folders = set()
+    batch, written = [], 0
+    for trip in generate_trips(config):
+        trip.blobs = {name: rng.choice(pool) for name in trip.attachments} if pool else {}
+        if sqlite:
+            batch.append(trip)
+            if len(batch) >= batch_size:
+                written += storage.save_trips(batch)
+                batch = []
+        else:
+            # TripManager's naming; suffix the city on the rare collision so both layouts hold the same trips
+            city, suffix = trip.city, 2
+            folder = readable_name(trip)
+            while folder in used_folders:
+                trip.city = f"{city}-{suffix}"
+                folder = readable_name(trip)
+                suffix += 1
+            used_folders.add(folder)
+            if by_id:
+                folder = trip.id
+                aliases.link(trip)
+            (path / folder).mkdir()
+            with open(path / folder / "metadata.json", 'w') as f:
+                json.dump(trip.to_dict(), f, indent=2)
+            written += 1
+        if written and written % 50000 == 0:
+            print(f"  {written} trips written", file=sys.stderr)
+    if batch:
+        written += storage.save_trips(batch)
+
+    with open(config_path(location), 'w') as f:
+        json.dump(asdict(config), f, indent=2)
+    return written
+
+
+def config_path(location: str) -> Path:
+    """Where write_store records the GeneratorConfig a store was built from."""
+    path = Path(location)
+    if location.endswith(SQLITE_SUFFIXES):
+        return path.with_name(path.name + ".benchmark.json")
+    return path / ".benchmark.json"
+
+
+def config_from_args(args: argparse.Namespace) -> GeneratorConfig:
+    return GeneratorConfig(**{name: getattr(args, name) for name in GeneratorConfig.__dataclass_fields__
+                              if hasattr(args, name)})
+
+
+def add_generator_arguments(parser: argparse.ArgumentParser):
+    defaults = GeneratorConfig()
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--countries", type=int, default=defaults.countries)
+    parser.add_argument("--country-skew", type=float, default=defaults.country_skew,
+                        help="Zipf exponent; 0 spreads trips evenly over countries")
+    parser.add_argument("--cities-per-country", type=int, default=defaults.cities_per_country)
+    parser.add_argument("--tags", type=int, default=defaults.tags, help="Size of the tag vocabulary")
+    parser.add_argument("--tag-skew", type=float, default=defaults.tag_skew)
+    parser.add_argument("--tags-per-trip", type=float, default=defaults.tags_per_trip, help="Mean tags per trip")
+    parser.add_argument("--attachment-rate", type=float, default=defaults.attachment_rate,
+                        help="Fraction of trips with attachments")
+    parser.add_argument("--attachments-per-trip", type=float, default=defaults.attachments_per_trip)
+    parser.add_argument("--attachment-kb", type=int, default=defaults.attachment_kb)
+    parser.add_argument("--attachment-pool", type=int, default=defaults.attachment_pool,
+                        help="Distinct attachment payloads shared by all trips")
+    parser.add_argument("--month-rate", type=float, default=defaults.month_rate,
+                        help="Fraction of trips with month-only dates")
+    parser.add_argument("--mean-days", type=float, default=defaults.mean_days)
+    parser.add_argument("--layout", choices=LAYOUTS, default=defaults.layout,
+                        help="Trip folder naming for filesystem stores")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("location", help="Directory to create, or a .db/.sqlite file")
+    parser.add_argument("--trips", type=int, default=1000)
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    target = Path(args.location)
+    if target.is_file() or (target.is_dir() and any(target.iterdir())):
+        parser.error(f"{args.location} already exists and is not empty")
+    start = time.perf_counter()
+    written = write_store(args.location, config_from_args(args))
+    print(f"Wrote {written} trips to {args.location} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Benchmark suite for the storage backends and the computations behind the app pages.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --trips 1000,10000 --output before.json
+    python -m benchmarks.suite --trips 1000,10000 --output after.json --compare before.json
+    python -m benchmarks.suite --trips 100000 --backend sqlite --only scan_trips,get_stats
+
+Stores are generated with benchmarks.generate into --data-dir and reused by
+later runs with the same generator settings, so two versions of the code
+are measured against identical data. Benchmarks that write undo their
+changes afterwards. Results are written as JSON; --compare prints the
+median time of each benchmark relative to an earlier results file.
+"""
+import argparse
+import hashlib
+import json
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from src import stats
+from src.aggregates import TripAggregates
+from src.models import Trip
+from src.storage import TripStorage, open_storage
+
+from .generate import GeneratorConfig, add_generator_arguments, config_from_args, config_path, write_store
+
+SAMPLE_SIZE = 200   # lookups per get_trip_by_id run
+WRITE_SIZE = 50     # trips written or deleted per run
+
+
+class Benchmark(NamedTuple):
+    name: str
+    run: Callable[[Any], int]                # returns the number of operations timed
+    setup: Optional[Callable[[], Any]] = None
+    teardown: Optional[Callable[[Any], None]] = None
+
+
+def store_location(data_dir: Path, backend: str, config: GeneratorConfig) -> str:
+    """Generates the store for config unless an identical one is already in data_dir."""
+    key = hashlib.sha1(json.dumps(asdict(config), sort_keys=True).encode()).hexdigest()[:10]
+    folder = data_dir / f"{backend}-{config.trips}-{key}"
+    location = str(folder / "trips.db") if backend == "sqlite" else str(folder)
+    try:
+        with open(config_path(location), 'r') as f:
+            if json.load(f) == asdict(config):
+                return location
+    except FileNotFoundError:
+        pass
+    shutil.rmtree(folder, ignore_errors=True)
+    print(f"Generating {config.trips} trips in {location}", file=sys.stderr)
+    write_store(location, config)
+    return location
+
+
+def build_benchmarks(location: str, storage: TripStorage, trips: List[Trip], seed: int) -> List[Benchmark]:
+    rng = random.Random(seed)
+    sample_ids = [trip.id for trip in rng.sample(trips, min(SAMPLE_SIZE, len(trips)))]
+    write_ids = [trip.id for trip in rng.sample(trips, min(WRITE_SIZE, len(trips)))]
+
+    def scan_cold(_):
+        open_storage(location).scan_trips()
+        return 1
+
+    def scan(_):
+        storage.scan_trips()
+        return 1
+
+    def scan_cached(_):
+        storage.scan_trips(use_cache=True)
+        return 1
+
+    def lookups(_):
+        for trip_id in sample_ids:
+            storage.get_trip_by_id(trip_id)
+        return len(sample_ids)
+
+    def load_write_trips():
+        return [storage.get_trip_by_id(trip_id) for trip_id in write_ids]
+
+    def update(targets):
+        for trip in targets:
+            trip.notes = f"{trip.notes} edited" if not trip.notes.endswith(" edited") else trip.notes[:-7]
+            storage.save_trip(trip)
+        return len(targets)
+
+    def rename(targets):
+        # A new city moves the trip to a different folder on the filesystem backend
+        for trip in targets:
+            trip.city = f"{trip.city} (renamed)"
+            storage.save_trip(trip)
+        return len(targets)
+
+    def undo_rename(targets):
+        for trip in targets:
+            trip.city = trip.city[:-len(" (renamed)")]
+            storage.save_trip(trip)
+
+    def new_trips():
+        return [replace(trip, id=str(uuid.uuid4()), city=f"{trip.city} (copy)", attachments=[], blobs={},
+                        version=0)
+                for trip in load_write_trips()]
+
+    def create(targets):
+        for trip in targets:
+            storage.save_trip(trip)
+        return len(targets)
+
+    def delete_all(targets):
+        for trip in targets:
+            storage.delete_trip(trip.id)
+        return len(targets)
+
+    def create_untimed():
+        targets = new_trips()
+        create(targets)
+        return targets
+
+    def get_stats(_):
+        stats.summarize(stats.trips_to_frame(trips))
+        return 1
+
+    def aggregates(tmp_dir):
+        aggregates = TripAggregates(Path(tmp_dir) / "aggregates.json")
+        aggregates.rebuild(trips)
+        aggregates.top_countries(3)
+        return 1
+
+    def analytics_frame(_):
+        frame = stats.trips_to_frame(trips)
+        stats.per_year(frame)
+        stats.per_country(frame)
+        return 1
+
+    def travel_calendar(_):
+        calendar = stats.travel_calendar(stats.trips_to_frame(trips))
+        calendar.max_rolling(180)
+        calendar.per_period((4, 6))
+        return 1
+
+    return [
+        Benchmark("scan_trips_cold", scan_cold),
+        Benchmark("scan_trips", scan),
+        Benchmark("scan_trips_cached", scan_cached, setup=lambda: storage.scan_trips(use_cache=True)),
+        Benchmark("get_trip_by_id", lookups),
+        Benchmark("save_trip_update", update, setup=load_write_trips),
+        Benchmark("save_trip_rename", rename, setup=load_write_trips, teardown=undo_rename),
+        Benchmark("save_trip_new", create, setup=new_trips, teardown=delete_all),
+        Benchmark("delete_trip", delete_all, setup=create_untimed),
+        Benchmark("get_stats", get_stats),
+        Benchmark("analytics_aggregates", aggregates, setup=tempfile.mkdtemp, teardown=shutil.rmtree),
+        Benchmark("analytics_frame", analytics_frame),
+        Benchmark("travel_calendar", travel_calendar),
+    ]
+
+
+def time_benchmark(benchmark: Benchmark, repeat: int) -> Dict[str, Any]:
+    runs, ops = [], 0
+    for _ in range(repeat):
+        state = benchmark.setup() if benchmark.setup else None
+        start = time.perf_counter()
+        ops = benchmark.run(state)
+        runs.append(time.perf_counter() - start)
+        if benchmark.teardown:
+            benchmark.teardown(state)
+    median = statistics.median(runs)
+    return {
+        "name": benchmark.name,
+        "ops": ops,
+        "runs": runs,
+        "min": min(runs),
+        "median": median,
+        "per_op_ms": median / ops * 1000 if ops else None,
+    }
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    """Prints current vs baseline medians. Returns the number of regressions beyond threshold."""
+    with open(baseline_path, 'r') as f:
+        baseline = {(r["backend"], r["trips"], r["name"]): r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"\n{'benchmark':<22} {'backend':<10} {'trips':>8} {'before (s)':>11} {'after (s)':>11} {'ratio':>7}")
+    for result in results:
+        before = baseline.get((result["backend"], result["trips"], result["name"]))
+        if before is None:
+            continue
+        ratio = result["median"] / before["median"] if before["median"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  slower"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{result['name']:<22} {result['backend']:<10} {result['trips']:>8} "
+              f"{before['median']:>11.4f} {result['median']:>11.4f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trips", dest="sizes", default="1000,10000", help="Comma separated store sizes")
+    parser.add_argument("--backend", choices=["filesystem", "sqlite", "all"], default="filesystem")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="Comma separated benchmark names to run")
+    parser.add_argument("--data-dir", default=str(Path(tempfile.gettempdir()) / "travellog-bench"),
+                        help="Where generated stores are kept between runs")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change reported by --compare")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 if --compare finds a slowdown beyond --threshold")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    backends = ["filesystem", "sqlite"] if args.backend == "all" else [args.backend]
+    only = set(args.only.split(",")) if args.only else None
+    data_dir = Path(args.data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    print(f"{'benchmark':<22} {'backend':<10} {'trips':>8} {'median (s)':>11} {'per op (ms)':>12}")
+    for backend in backends:
+        for count in (int(n) for n in args.sizes.split(",")):
+            config = replace(config_from_args(args), trips=count)
+            location = store_location(data_dir, backend, config)
+            storage = open_storage(location)
+            trips = storage.scan_trips()
+            for benchmark in build_benchmarks(location, storage, trips, config.seed):
+                if only and benchmark.name not in only:
+                    continue
+                result = {"backend": backend, "trips": count, **time_benchmark(benchmark, args.repeat)}
+                results.append(result)
+                per_op = f"{result['per_op_ms']:.3f}" if result["per_op_ms"] is not None else "-"
+                print(f"{result['name']:<22} {backend:<10} {count:>8} {result['median']:>11.4f} {per_op:>12}")
+
+    if args.output:
+        generator = asdict(config_from_args(args))
+        del generator["trips"]
+        with open(args.output, 'w') as f:
+            json.dump({"environment": environment(), "generator": generator,
+                       "repeat": args.repeat, "results": results}, f, indent=2)
+        print(f"\nWrote {len(results)} results to {args.output}")
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Materialized analytics aggregates, kept up to date from storage change events.
+
+    python -m src.aggregates rebuild trips_data     # recompute from scratch
+"""
+import argparse
+import hashlib
+import json
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from threading import RLock
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import logging
+from .dates import parse_trip_date
+from . import instrumentation
+from .events import TripEvent
+from .locks import DeferredFlush, FileLock, write_json_atomic
+from .models import CompactTrip, Trip
+from .thumbnails import is_image
+
+logger = logging.getLogger(__name__)
+
+AGGREGATES_FILENAME = "aggregates.json"
+AGGREGATES_VERSION = 3
+_FINGERPRINT_MASK = (1 << 64) - 1
+
+
+def trip_stay(trip: Union[Trip, CompactTrip]) -> Optional[Tuple[int, int]]:
+    """(start, end) date ordinals of a trip, or None if a date is unparsable."""
+    try:
+        start, _ = parse_trip_date(trip.start_date)
+        end, _ = parse_trip_date(trip.end_date)
+    except (ValueError, TypeError):
+        return None
+    return start, end
+
+
+def trip_days(trip: Trip) -> int:
+    """Days between start and end date, as counted by get_stats (0 if unparsable)."""
+    stay = trip_stay(trip)
+    return max(0, stay[1] - stay[0]) if stay else 0
+
+
+def nights_away(stays: Iterable[Tuple[int, int]]) -> int:
+    """Nights covered by at least one (start, end) stay, as stats.summarize counts them."""
+    total, current = 0, None
+    for start, end in sorted(stays):
+        if end <= start:
+            continue
+        if current is None or start > current[1]:
+            if current is not None:
+                total += current[1] - current[0]
+            current = [start, end]
+        else:
+            current[1] = max(current[1], end)
+    return total + (current[1] - current[0] if current else 0)
+
+
+def trip_year(trip: Trip) -> Optional[str]:
+    try:
+        return str(date.fromordinal(parse_trip_date(trip.start_date)[0]).year)
+    except (ValueError, TypeError):
+        return None
+
+
+def version_fingerprint(trip_id: str, version: int) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{trip_id}:{version}".encode(), digest_size=8).digest(), "big")
+
+
+def trip_fingerprint(trip: Union[Trip, CompactTrip]) -> int:
+    return version_fingerprint(trip.id, trip.version)
+
+
+def add_fingerprints(*fingerprints: int) -> int:
+    """Combines fingerprints of disjoint sets of trips (negate one to take it out)."""
+    return sum(fingerprints) & _FINGERPRINT_MASK
+
+
+def store_fingerprint(trips: Iterable[Union[Trip, CompactTrip]]) -> int:
+    """Order-independent digest of the (id, version) pairs of a store's trips."""
+    return sum(map(trip_fingerprint, trips)) & _FINGERPRINT_MASK
+
+
+class TripAggregates:
+    """Per-country and per-city visit counts, per-year trip/day totals and per-country photo candidates.
+
+    Every change is applied as a delta: the previous version of a trip is
+    subtracted and the new one added. Deltas are written to disk at once,
+    or with a flush_delay at most once per delay. Before writing, the file
+    is reloaded if another process rewrote it since we last read it, and the
+    deltas not yet on disk are applied again on top; a lock file next to it
+    keeps processes from interleaving reload and save.
+
+    The fingerprint of the trips the totals were computed from is kept with
+    them, so a store changed while no process was listening is noticed and
+    rebuilt when it is next opened.
+    """
+
+    def __init__(self, path: Path, flush_delay: float = 0.0):
+        self.path = Path(path)
+        self.flush_delay = flush_delay
+        self.countries: Dict[str, int] = {}
+        self.cities: Dict[str, Dict[str, int]] = {}  # country -> city -> visits
+        self.years: Dict[str, Dict[str, int]] = {}
+        self.images: Dict[str, List[List[Any]]] = {}  # country -> [[trip_id, filename, digest]]
+        self.fingerprint = 0  # store_fingerprint of the trips counted
+        # [fingerprint, days]: overlap-aware days need every trip's dates, so they are recorded by
+        # rebuild() and record_days_traveled() instead of maintained
+        self.days_traveled: Optional[List[int]] = None
+        self._mtime: Optional[int] = None
+        self._lock = RLock()
+        self._file_lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        self._batch_depth = 0
+        # (sign, trip) deltas applied in memory but not yet written to disk
+        self._pending: List[Tuple[int, CompactTrip]] = []
+        self._deferred = DeferredFlush(self.flush, flush_delay)
+        self.loaded = self._load()
+
+    def _load(self) -> bool:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get("version") != AGGREGATES_VERSION:
+                return False
+            self.countries = data["countries"]
+            self.cities = data["cities"]
+            self.years = data["years"]
+            self.images = data["images"]
+            self.fingerprint = data["fingerprint"]
+            self.days_traveled = data.get("days_traveled")
+            self._mtime = self.path.stat().st_mtime_ns
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Aggregates at {self.path} are corrupt and need a rebuild: {e}")
+            return False
+
+    def save(self):
+        """Atomically writes the aggregates to disk. Callers hold the file lock."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with instrumentation.span("aggregates.save"):
+            write_json_atomic(self.path, {
+                "version": AGGREGATES_VERSION,
+                "countries": self.countries,
+                "cities": self.cities,
+                "years": self.years,
+                "images": self.images,
+                "fingerprint": self.fingerprint,
+                "days_traveled": self.days_traveled,
+            })
+        self._mtime = self.path.stat().st_mtime_ns
+
+    @contextmanager
+    def batch(self):
+        """Defers writing to disk until the outermost batch finishes."""
+        # Not held across the yield: callers take trip locks inside a batch, while savers
+        # holding a trip lock wait for this lock in handle_event
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                done = self._batch_depth == 0
+            if done:
+                self.flush()
+
+    def flush(self):
+        """Writes the deltas not yet on disk, merged with whatever other processes wrote meanwhile."""
+        with self._lock:
+            self._deferred.cancel()
+            if not self._pending:
+                return
+            with self._file_lock:
+                self._merge()
+                self.save()
+
+    def _merge(self):
+        """Reloads the file if another process rewrote it, and applies our pending deltas on top. Callers hold both locks."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime and mtime is not None and self._load():
+            for sign, trip in self._pending:
+                self._apply(trip, sign)
+        self._pending = []
+
+    def known_days_traveled(self) -> Optional[int]:
+        """Days traveled, overlaps counted once, if recorded for the trips counted now; else None."""
+        recorded = self.days_traveled
+        return recorded[1] if recorded is not None and recorded[0] == self.fingerprint else None
+
+    def record_days_traveled(self, fingerprint: int, days: int):
+        """Keeps days traveled as computed from the trips with the given store fingerprint."""
+        with self._lock, self._file_lock:
+            self._deferred.cancel()
+            self._merge()
+            self.days_traveled = [fingerprint, days]
+            self.save()
+
+    def _apply(self, trip: Union[Trip, CompactTrip], sign: int):
+        self.fingerprint = (self.fingerprint + sign * trip_fingerprint(trip)) & _FINGERPRINT_MASK
+        self.countries[trip.country] = self.countries.get(trip.country, 0) + sign
+        if self.countries[trip.country] <= 0:
+            del self.countries[trip.country]
+
+        cities = self.cities.setdefault(trip.country, {})
+        cities[trip.city] = cities.get(trip.city, 0) + sign
+        if cities[trip.city] <= 0:
+            del cities[trip.city]
+            if not cities:
+                del self.cities[trip.country]
+
+        year = trip_year(trip)
+        if year is not None:
+            totals = self.years.setdefault(year, {"trips": 0, "days": 0})
+            totals["trips"] += sign
+            totals["days"] += sign * trip_days(trip)
+            if totals["trips"] <= 0:
+                del self.years[year]
+
+        if sign > 0:
+            candidates = [[trip.id, att, trip.blobs.get(att)] for att in trip.attachments if is_image(att)]
+            if candidates:
+                self.images.setdefault(trip.country, []).extend(candidates)
+        elif trip.country in self.images:
+            remaining = [c for c in self.images[trip.country] if c[0] != trip.id]
+            if remaining:
+                self.images[trip.country] = remaining
+            else:
+                del self.images[trip.country]
+
+    def handle_event(self, event: TripEvent):
+        """Storage listener: applies one change as a delta.
+
+        External changes were made by another process, whose aggregates (if
+        it keeps any) already hold them; they are applied in memory but not
+        queued, or the next merge with the file on disk would count them twice.
+        """
+        with self._lock:
+            for sign, trip in ((-1, event.previous), (+1, event.trip)):
+                if trip is not None:
+                    self._apply(trip, sign)
+                    if not event.external:
+                        # Snapshots, since callers may keep modifying the Trip objects they saved
+                        self._pending.append((sign, CompactTrip.from_trip(trip)))
+            if event.external:
+                return
+            if self._batch_depth:
+                return
+            if self.flush_delay > 0:
+                self._deferred.schedule()
+                return
+            self.flush()
+
+    def rebuild(self, trips: Iterable[Trip]):
+        """Recomputes everything from the given trips."""
+        with self._lock, self._file_lock:
+            self._deferred.cancel()
+            self._pending = []
+            self.countries, self.cities, self.years, self.images = {}, {}, {}, {}
+            self.fingerprint = 0
+            stays = []
+            for trip in trips:
+                self._apply(trip, +1)
+                stay = trip_stay(trip)
+                if stay is not None:
+                    stays.append(stay)
+            self.days_traveled = [self.fingerprint, nights_away(stays)]
+            self.save()
+            self.loaded = True
+
+    def top_countries(self, n: int) -> List[tuple]:
+        return sorted(self.countries.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def top_cities(self, n: int) -> List[Tuple[str, str, int]]:
+        """(city, country, visits) of the n most visited cities."""
+        visits = [(city, country, count) for country, cities in self.cities.items() for city, count in cities.items()]
+        return sorted(visits, key=lambda item: item[2], reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain materialized analytics aggregates.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("location", help="trips_data directory or SQLite file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from .storage import open_storage
+    storage = open_storage(args.location)
+    storage.aggregates.rebuild(storage.iter_trips())
+    print(f"Rebuilt aggregates for {sum(storage.aggregates.countries.values())} trips")
+
+
+if __name__ == "__main__":
+    main()
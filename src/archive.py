@@ -0,0 +1,304 @@
+"""Cold storage for old trips: zip archives under .archive/ and a catalog of their metadata.
+
+    python -m src.archive compact trips_data --before 2020-01-01
+    python -m src.archive list trips_data
+    python -m src.archive rebuild-catalog trips_data
+
+Compaction packs every trip that ended before the cutoff into one new zip
+file: <trip id>/metadata.json per trip, blobs/<sha256> once per distinct
+blob store attachment, and <trip id>/<name> for attachments older trips keep
+in their folder. The trip folders are then removed. The
+catalog holds the metadata of every archived trip, so scans never open the
+zips. Attachments are stored uncompressed and read from their zip member by
+random access. Saving an archived trip moves it back into a folder.
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import uuid
+import zipfile
+from datetime import date
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+from .dates import MONTH, parse_trip_date
+from .locks import FileLock, write_json_atomic
+from .models import Trip
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIRNAME = ".archive"
+CATALOG_FILENAME = "catalog.json"
+CATALOG_VERSION = 1
+METADATA_MEMBER = "metadata.json"
+BLOB_PREFIX = "blobs/"
+
+
+def _member_name(trip: Trip, filename: str) -> str:
+    digest = trip.blobs.get(filename)
+    return BLOB_PREFIX + digest if digest else f"{trip.id}/{filename}"
+
+
+def ends_before(trip: Trip, cutoff: date) -> bool:
+    """Whether the trip was over before cutoff (a month-only end date covers the whole month)."""
+    try:
+        end, precision = parse_trip_date(trip.end_date)
+    except (ValueError, TypeError):
+        return False
+    if precision == MONTH:
+        last = date.fromordinal(end)
+        end = date(last.year + last.month // 12, last.month % 12 + 1, 1).toordinal() - 1
+    return end < cutoff.toordinal()
+
+
+class TripArchive:
+    """The archive files of one data directory and the catalog of the trips in them.
+
+    The catalog is re-read whenever its file changes, so archives written by
+    another process (the compaction command) show up without a restart.
+    """
+
+    def __init__(self, base_path: Path):
+        self.root = Path(base_path) / ARCHIVE_DIRNAME
+        self.catalog_path = self.root / CATALOG_FILENAME
+        self._entries: Dict[str, Tuple[str, Trip]] = {}  # trip id -> (archive file name, trip)
+        self._sorted: List[Trip] = []
+        self._keys: List[Tuple[str, str]] = []
+        self._mtime: Optional[int] = None
+        self._generation = 0
+        self._zips: Dict[str, Tuple[int, zipfile.ZipFile]] = {}
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(self.root / (CATALOG_FILENAME + ".lock"))
+
+    def refresh(self):
+        """Reloads the catalog if it changed on disk. Costs one stat otherwise."""
+        try:
+            mtime = self.catalog_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            self._set_entries(self._read_catalog() if mtime is not None else {})
+            self._mtime = mtime
+
+    def _read_catalog(self) -> Dict[str, Tuple[str, Trip]]:
+        try:
+            with open(self.catalog_path, 'r') as f:
+                data = json.load(f)
+            if data.get("version") != CATALOG_VERSION:
+                logger.warning(f"Archive catalog {self.catalog_path} has an unknown version, ignoring it")
+                return {}
+            return {trip_id: (record["archive"], Trip.from_dict(record["trip"]))
+                    for trip_id, record in data["trips"].items()}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Archive catalog {self.catalog_path} is corrupt, run rebuild-catalog: {e}")
+            return {}
+
+    def _set_entries(self, entries: Dict[str, Tuple[str, Trip]]):
+        self._entries = entries
+        self._sorted = sorted((trip for _, trip in entries.values()), key=lambda x: x.start_date, reverse=True)
+        self._keys = sorted((trip.start_date, trip_id) for trip_id, (_, trip) in entries.items())
+        self._generation += 1
+
+    def _write_catalog(self, entries: Dict[str, Tuple[str, Trip]]):
+        self.root.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.catalog_path, {
+            "version": CATALOG_VERSION,
+            "trips": {trip_id: {"archive": name, "trip": trip.to_dict()} for trip_id, (name, trip) in entries.items()},
+        })
+        with self._lock:
+            self._set_entries(entries)
+            self._mtime = self.catalog_path.stat().st_mtime_ns
+
+    @property
+    def generation(self) -> int:
+        self.refresh()
+        return self._generation
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._entries)
+
+    def trips(self) -> List[Trip]:
+        """Archived trips by start date descending (shared objects; do not modify)."""
+        self.refresh()
+        return self._sorted
+
+    def sort_keys(self) -> List[Tuple[str, str]]:
+        """(start_date, id) of every archived trip in ascending order."""
+        self.refresh()
+        return self._keys
+
+    def lookup(self, trip_id: str) -> Optional[str]:
+        """Returns the archive file holding the trip, or None."""
+        self.refresh()
+        entry = self._entries.get(trip_id)
+        return entry[0] if entry else None
+
+    def get(self, trip_id: str) -> Optional[Trip]:
+        self.refresh()
+        entry = self._entries.get(trip_id)
+        return entry[1].copy() if entry else None
+
+    def _zip(self, name: str) -> Tuple[int, zipfile.ZipFile]:
+        """An open archive (its central directory read once), reopened if the file was replaced."""
+        path = self.root / name
+        mtime = path.stat().st_mtime_ns
+        with self._lock:
+            cached = self._zips.get(name)
+            if cached is None or cached[0] != mtime:
+                if cached is not None:
+                    cached[1].close()
+                cached = self._zips[name] = (mtime, zipfile.ZipFile(path))
+            return cached
+
+    def _member(self, trip_id: str, filename: str) -> Tuple[str, int, zipfile.ZipInfo, zipfile.ZipFile]:
+        self.refresh()
+        entry = self._entries.get(trip_id)
+        if entry is None:
+            raise FileNotFoundError(f"Trip {trip_id} is not archived")
+        name, trip = entry
+        mtime, archive = self._zip(name)
+        try:
+            return name, mtime, archive.getinfo(_member_name(trip, filename)), archive
+        except KeyError:
+            raise FileNotFoundError(f"{filename} of trip {trip_id} is not in {name}") from None
+
+    def open_member(self, trip_id: str, filename: str) -> BinaryIO:
+        """Opens one archived attachment for reading, without extracting anything else."""
+        _, _, info, archive = self._member(trip_id, filename)
+        return archive.open(info)
+
+    def member_key(self, trip_id: str, filename: str) -> Tuple[str, int, int]:
+        """(location, mtime, size) of an archived attachment, for caches."""
+        name, mtime, info, _ = self._member(trip_id, filename)
+        return (f"{self.root / name}/{info.filename}", mtime, info.file_size)
+
+    def write_archive(self, trips: Iterable[Trip], open_attachment: Callable[[Trip, str], BinaryIO]) -> str:
+        """Writes a new zip file with the trips' metadata and attachments. Returns its file name.
+
+        Attachments that cannot be opened are left out with a warning.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        name = f"{date.today():%Y%m%d}-{uuid.uuid4().hex[:8]}.zip"
+        tmp_path = self.root / f".{name}.tmp"
+        written = set()
+        try:
+            with zipfile.ZipFile(tmp_path, "w") as archive:
+                for trip in trips:
+                    archive.writestr(f"{trip.id}/{METADATA_MEMBER}", json.dumps(trip.to_dict(), indent=2),
+                                     compress_type=zipfile.ZIP_DEFLATED)
+                    for filename in trip.attachments:
+                        member = _member_name(trip, filename)
+                        if member in written:
+                            continue  # the same blob attached to an earlier trip
+                        try:
+                            source = open_attachment(trip, filename)
+                        except FileNotFoundError:
+                            logger.warning(f"Attachment {filename} of trip {trip.id} is missing, not archiving it")
+                            continue
+                        # Stored, not deflated: photos and PDFs barely compress, and stored members seek cheaply
+                        with source, archive.open(member, "w", force_zip64=True) as target:
+                            shutil.copyfileobj(source, target, 1024 * 1024)
+                        written.add(member)
+            with open(tmp_path, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.root / name)
+        except BaseException:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        return name
+
+    def add(self, name: str, trips: Iterable[Trip]):
+        """Records trips as stored in archive file name."""
+        with self._file_lock:
+            entries = self._read_catalog()
+            for trip in trips:
+                entries[trip.id] = (name, trip.copy())
+            self._write_catalog(entries)
+
+    def forget(self, trip_ids: Iterable[str]):
+        """Drops trips from the catalog (their archive members stay behind, unreferenced)."""
+        with self._file_lock:
+            entries = self._read_catalog()
+            removed = [entries.pop(trip_id) for trip_id in trip_ids if trip_id in entries]
+            if removed:
+                self._write_catalog(entries)
+
+    def collect_garbage(self) -> int:
+        """Deletes archive files no archived trip refers to any more. Returns how many were deleted."""
+        if not self.root.exists():
+            return 0
+        removed = 0
+        with self._file_lock:
+            self.refresh()
+            referenced = {name for name, _ in self._entries.values()}
+            for path in self.root.glob("*.zip"):
+                # Newer than the catalog: written by a compaction that has yet to record its trips
+                if path.name in referenced or self._mtime is None or path.stat().st_mtime_ns > self._mtime:
+                    continue
+                with self._lock:
+                    cached = self._zips.pop(path.name, None)
+                if cached is not None:
+                    cached[1].close()
+                path.unlink()
+                removed += 1
+        return removed
+
+    def rebuild_catalog(self) -> int:
+        """Recreates the catalog from the metadata inside every archive. Returns the number of trips.
+
+        Trips found in several archives keep the newest version.
+        """
+        entries: Dict[str, Tuple[str, Trip]] = {}
+        with self._file_lock:
+            for path in sorted(self.root.glob("*.zip")):
+                with zipfile.ZipFile(path) as archive:
+                    for info in archive.infolist():
+                        if not info.filename.endswith("/" + METADATA_MEMBER):
+                            continue
+                        trip = Trip.from_dict(json.loads(archive.read(info)))
+                        if trip.id not in entries or entries[trip.id][1].version <= trip.version:
+                            entries[trip.id] = (path.name, trip)
+            self._write_catalog(entries)
+        return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    compact_parser = commands.add_parser("compact", help="Archive trips that ended before a date")
+    compact_parser.add_argument("location", help="trips_data directory")
+    compact_parser.add_argument("--before", required=True, type=date.fromisoformat, help="Cutoff, YYYY-MM-DD")
+    list_parser = commands.add_parser("list", help="Show the archives and how many trips each holds")
+    list_parser.add_argument("location")
+    rebuild_parser = commands.add_parser("rebuild-catalog", help="Recreate the catalog from the archives")
+    rebuild_parser.add_argument("location")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from .manager import TripManager
+    manager = TripManager(args.location, flush_delay=0)
+    if args.command == "compact":
+        archived = manager.compact(args.before)
+        print(f"Archived {archived} trips that ended before {args.before}")
+    elif args.command == "list":
+        counts: Dict[str, int] = {}
+        for trip in manager.archive.trips():
+            name = manager.archive.lookup(trip.id)
+            counts[name] = counts.get(name, 0) + 1
+        for name, count in sorted(counts.items()):
+            size = (manager.archive.root / name).stat().st_size
+            print(f"{name}  {count} trips  {size / 1024 / 1024:.1f} MiB")
+    else:
+        print(f"Catalog rebuilt with {manager.archive.rebuild_catalog()} trips")
+
+
+if __name__ == "__main__":
+    main()
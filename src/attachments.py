@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import BinaryIO, Callable, Dict, Tuple
+from . import instrumentation
+
+# (path, st_mtime_ns, st_size), or another location for attachments not stored as plain files
+CacheKey = Tuple[str, int, int]
+
+
+class AttachmentCache:
+    """Least-recently-used cache of attachment bytes, bounded by their total size.
+
+    Entries are keyed by path, mtime and size, so a replaced file is never
+    served stale. Files larger than max_item_bytes are read on demand and
+    never cached, so one huge video cannot evict everything else.
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024, max_item_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = min(max_item_bytes, max_bytes)
+        self._entries: "OrderedDict[CacheKey, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, path: Path) -> bytes:
+        """Returns the contents of path, from the cache when possible."""
+        st = Path(path).stat()
+        return self.read_from((str(path), st.st_mtime_ns, st.st_size), lambda: open(path, "rb"))
+
+    def read_from(self, key: CacheKey, opener: Callable[[], BinaryIO]) -> bytes:
+        """Returns the contents identified by key, calling opener to read them on a miss.
+
+        Use with TripStorage.attachment_key and open_attachment for attachments
+        that may not be plain files, such as those of archived trips.
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                instrumentation.count("attachments.cache_hits")
+                return data
+            self.misses += 1
+
+        with instrumentation.span("attachments.read"), opener() as f:
+            data = f.read()
+        instrumentation.count("attachments.bytes_read", len(data))
+
+        if len(data) <= self.max_item_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = data
+                    self._size += len(data)
+                    while self._size > self.max_bytes:
+                        _, evicted = self._entries.popitem(last=False)
+                        self._size -= len(evicted)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
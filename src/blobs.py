@@ -0,0 +1,76 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterable, Tuple
+
+BLOB_DIRNAME = ".blobs"
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """Content-addressed attachment storage.
+
+    Each distinct file is stored once under .blobs/<aa>/<sha256>, where <aa>
+    is the first two hex digits of the digest. Files are streamed in
+    CHUNK_SIZE pieces while hashing, so memory use does not depend on the
+    file size.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.path_for(digest).exists()
+
+    def put(self, stream: BinaryIO) -> Tuple[str, int]:
+        """Stores the contents of a readable binary stream. Returns (sha256 digest, size)."""
+        if hasattr(stream, "seek"):
+            stream.seek(0)
+
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+            digest = hasher.hexdigest()
+            final_path = self.path_for(digest)
+            if final_path.exists():
+                # Already stored by an earlier upload; keep the existing copy.
+                os.unlink(tmp_name)
+            else:
+                final_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_name, final_path)
+            return digest, size
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    def collect_garbage(self, referenced: Iterable[str]) -> int:
+        """Deletes blobs not in referenced. Returns the number of blobs removed."""
+        keep = set(referenced)
+        removed = 0
+        if not self.root.exists():
+            return removed
+        for shard in self.root.iterdir():
+            if not shard.is_dir() or shard.name == "tmp":
+                continue
+            for blob in shard.iterdir():
+                if blob.name not in keep:
+                    blob.unlink()
+                    removed += 1
+        return removed
@@ -0,0 +1,95 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .models import Trip
+
+# (st_mtime_ns, st_size, st_ino) of a folder's metadata.json
+Signature = Tuple[int, int, int]
+
+MISSING = object()
+
+
+class ScanCache:
+    """Keeps parsed trips between scans, keyed by folder name.
+
+    An entry is only trusted while the stat signature of the folder's
+    metadata.json is unchanged. Rewrites in place change the mtime/size and
+    atomic replaces change the inode, so one stat per folder is enough to
+    decide whether it has to be re-read. Folders whose metadata failed to
+    parse are cached as None so a broken file is not re-read on every scan.
+    Safe to share between threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Signature, Optional[Trip]]] = {}
+        self._sorted: Optional[List[Trip]] = None
+        self.hits = 0
+        self.misses = 0
+        # Bumped whenever the sorted trip list is rebuilt, so callers can key derived data on it
+        self.generation = 0
+        # True once a full scan has populated the cache
+        self.primed = False
+
+    def get(self, folder_name: str, signature: Signature) -> Any:
+        """Returns the cached trip (or None for a broken folder), or MISSING."""
+        with self._lock:
+            entry = self._entries.get(folder_name)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return MISSING
+
+    def matches(self, folder_name: str, signature: Optional[Signature]) -> bool:
+        """Whether the entry for a folder is up to date (signature None: the folder is gone and not cached)."""
+        entry = self._entries.get(folder_name)
+        if signature is None:
+            return entry is None
+        return entry is not None and entry[0] == signature
+
+    def peek(self, folder_name: str) -> Optional[Trip]:
+        """Returns the cached trip for a folder regardless of freshness, without counting a hit."""
+        entry = self._entries.get(folder_name)
+        return entry[1] if entry else None
+
+    def folders(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def put(self, folder_name: str, signature: Signature, trip: Optional[Trip]):
+        with self._lock:
+            self._entries[folder_name] = (signature, trip)
+            self._sorted = None
+
+    def retain(self, folder_names: Iterable[str]):
+        """Drops entries for folders that no longer exist."""
+        keep = set(folder_names)
+        with self._lock:
+            stale = [name for name in self._entries if name not in keep]
+            for name in stale:
+                del self._entries[name]
+            if stale:
+                self._sorted = None
+
+    def invalidate(self, folder_name: Optional[str] = None):
+        """Forgets one folder, or everything when no folder is given."""
+        with self._lock:
+            if folder_name is None:
+                self._entries.clear()
+                self.primed = False
+            else:
+                self._entries.pop(folder_name, None)
+            self._sorted = None
+
+    def sorted_trips(self) -> List[Trip]:
+        """Returns cached trips by start date descending, re-sorting only after a change."""
+        with self._lock:
+            if self._sorted is None:
+                trips = [trip for _, trip in self._entries.values() if trip is not None]
+                trips.sort(key=lambda x: x.start_date, reverse=True)
+                self._sorted = trips
+                self.generation += 1
+            return list(self._sorted)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,20 @@
+from datetime import date
+from typing import Tuple
+
+# Precision of a trip date string
+DAY = "day"      # YYYY-MM-DD
+MONTH = "month"  # YYYY-MM
+
+
+def parse_trip_date(value: str) -> Tuple[int, str]:
+    """Parses a YYYY-MM-DD or YYYY-MM string into (date ordinal, precision).
+
+    Month-precision dates map to the first day of the month. Raises
+    ValueError for anything else.
+    """
+    if len(value) == 10:
+        return date.fromisoformat(value).toordinal(), DAY
+    year, month = value.split("-")
+    if len(year) != 4 or len(month) != 2:
+        raise ValueError(f"Invalid trip date: {value!r}")
+    return date(int(year), int(month), 1).toordinal(), MONTH
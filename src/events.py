@@ -0,0 +1,20 @@
+from dataclasses import dataclass
+from typing import Callable, Optional
+from .models import Trip
+
+ADDED = "added"
+CHANGED = "changed"
+REMOVED = "removed"
+
+
+@dataclass
+class TripEvent:
+    """A change to one trip, published by storage backends to their subscribers."""
+    kind: str                         # ADDED, CHANGED or REMOVED
+    trip_id: str
+    trip: Optional[Trip] = None       # State after the change (None when removed)
+    previous: Optional[Trip] = None   # State before the change, when known
+    external: bool = False            # Made outside this manager (relayed by sync_folder), already on disk
+
+
+TripListener = Callable[[TripEvent], None]
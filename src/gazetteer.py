@@ -0,0 +1,284 @@
+"""Offline coordinates for countries and major cities, read from a memory-mapped file.
+
+    python -m src.gazetteer lookup "Germany, Federal Republic Of"
+    python -m src.gazetteer lookup Munich --country Deutschland
+    python -m src.gazetteer build       # recompile data/gazetteer.bin after editing data/gazetteer.tsv
+
+The compiled file holds fixed-size place records, a sorted table of
+normalized lookup keys and a string pool. Nothing is parsed at startup:
+the file is mapped on the first lookup and each name costs one binary
+search over the key table, touching only the pages it reads.
+"""
+import argparse
+import difflib
+import mmap
+import re
+import struct
+import threading
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent / "data"
+SOURCE_PATH = DATA_DIR / "gazetteer.tsv"
+DATA_PATH = DATA_DIR / "gazetteer.bin"
+
+MAGIC = b"TLGZ"
+FORMAT_VERSION = 1
+COUNTRY, CITY = 0, 1
+FUZZY_CUTOFF = 0.85
+# One typo in a short name costs more of its similarity ratio ("frnace" scores 0.83 against "france")
+SHORT_NAME, SHORT_FUZZY_CUTOFF = 8, 0.8
+
+_HEADER = struct.Struct("<4sHIII")  # magic, version, places, keys, string pool offset
+_PLACE = struct.Struct("<ii2sBIH")  # lat and lon in 1e-5 degrees, country code, kind, name offset and length
+_KEY = struct.Struct("<IHI")  # key offset and length, place index
+_SCALE = 100000
+
+# Key namespaces: countries, and cities with or without their country code
+_COUNTRY_KEY = "C"
+_CITY_KEY = "T"
+_CODE_SEPARATOR = "\x1f"
+
+_TOKENS = {"st": "saint", "ste": "sainte", "mt": "mount", "ft": "fort"}
+# Letters NFKD does not split into a base letter and a combining mark
+_LETTERS = str.maketrans({"đ": "d", "ø": "o", "ł": "l", "ı": "i", "æ": "ae", "œ": "oe", "þ": "th"})
+
+
+def normalize(name: str) -> str:
+    """Lookup form of a place name: case, accents and punctuation dropped, common abbreviations expanded."""
+    text = unicodedata.normalize("NFKD", name.casefold().replace("&", " and ").translate(_LETTERS))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_TOKENS.get(token, token) for token in re.sub(r"[\W_]+", " ", text).split())
+
+
+def _country_variants(name: str) -> List[str]:
+    """Spellings to try for a country name as written in official lists ("Korea, Republic of")."""
+    variants = [name]
+    without_brackets = re.sub(r"\s*\(.*?\)", "", name).strip()
+    if without_brackets != name:
+        variants.append(without_brackets)
+    parts = [part.strip() for part in without_brackets.split(",") if part.strip()]
+    if len(parts) > 1:
+        variants.append(" ".join(reversed(parts)))
+        variants.append(parts[0])
+    return variants + [v[4:] for v in variants if v.lower().startswith("the ")]
+
+
+@dataclass(frozen=True)
+class Place:
+    name: str
+    country_code: str
+    lat: float
+    lon: float
+    kind: int  # COUNTRY or CITY
+
+    @property
+    def coords(self) -> Tuple[float, float]:
+        return (self.lat, self.lon)
+
+
+class Gazetteer:
+    """Country and city lookups against the compiled gazetteer.
+
+    Results, including misses, are memoized per name, so resolving the same
+    trip countries on every rerun costs a dict lookup. Names with no exact
+    match are matched fuzzily against the names of the same kind (and, for
+    cities, the same country); the candidate names are only read for that.
+    """
+
+    def __init__(self, path: Path = DATA_PATH):
+        self.path = Path(path)
+        self._mm: Optional[mmap.mmap] = None
+        self._place_count = 0
+        self._key_count = 0
+        self._keys_offset = 0
+        self._strings_offset = 0
+        self._names: Optional[Dict[str, List[str]]] = None  # namespace -> normalized names, for fuzzy matching
+        self._countries: Dict[str, Optional[Place]] = {}
+        self._cities: Dict[Tuple[str, Optional[str]], Optional[Place]] = {}
+        self._lock = threading.Lock()
+
+    def _map(self) -> mmap.mmap:
+        if self._mm is None:
+            with self._lock:
+                if self._mm is None:
+                    with open(self.path, "rb") as f:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    magic, version, places, keys, strings = _HEADER.unpack_from(mm, 0)
+                    if magic != MAGIC or version != FORMAT_VERSION:
+                        mm.close()
+                        raise ValueError(f"{self.path} is not a gazetteer of version {FORMAT_VERSION}")
+                    self._place_count, self._key_count, self._strings_offset = places, keys, strings
+                    self._keys_offset = _HEADER.size + places * _PLACE.size
+                    self._mm = mm
+        return self._mm
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+
+    def _string(self, offset: int, length: int) -> bytes:
+        start = self._strings_offset + offset
+        return self._mm[start:start + length]
+
+    def _find(self, key: str) -> Optional[int]:
+        """Binary search of the key table. Returns the place index, or None."""
+        mm = self._map()
+        target = key.encode("utf-8")
+        lo, hi = 0, self._key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length, place = _KEY.unpack_from(mm, self._keys_offset + mid * _KEY.size)
+            probe = self._string(offset, length)
+            if probe < target:
+                lo = mid + 1
+            elif probe > target:
+                hi = mid
+            else:
+                return place
+        return None
+
+    def _place(self, index: int) -> Place:
+        lat, lon, code, kind, offset, length = _PLACE.unpack_from(self._map(), _HEADER.size + index * _PLACE.size)
+        return Place(self._string(offset, length).decode("utf-8"), code.decode("ascii"),
+                     lat / _SCALE, lon / _SCALE, kind)
+
+    def _candidates(self, namespace: str) -> List[str]:
+        if self._names is None:
+            mm = self._map()
+            names: Dict[str, List[str]] = {}
+            for i in range(self._key_count):
+                offset, length, _ = _KEY.unpack_from(mm, self._keys_offset + i * _KEY.size)
+                key = self._string(offset, length).decode("utf-8")
+                name, _, code = key[1:].partition(_CODE_SEPARATOR)
+                names.setdefault(key[0] + (_CODE_SEPARATOR + code if code else ""), []).append(name)
+            self._names = names
+        return self._names.get(namespace, [])
+
+    def _lookup(self, namespace: str, name: str, suffix: str = "") -> Optional[Place]:
+        """Exact, then fuzzy lookup of a normalized name within one namespace."""
+        index = self._find(namespace + name + suffix)
+        if index is None:
+            cutoff = SHORT_FUZZY_CUTOFF if len(name) <= SHORT_NAME else FUZZY_CUTOFF
+            matches = difflib.get_close_matches(name, self._candidates(namespace + suffix), 1, cutoff)
+            if matches:
+                index = self._find(namespace + matches[0] + suffix)
+        return self._place(index) if index is not None else None
+
+    def country(self, name: str) -> Optional[Place]:
+        """The country called name (any listed spelling, or its ISO code), or None."""
+        if name in self._countries:
+            return self._countries[name]
+        place = None
+        keys = [key for key in map(normalize, _country_variants(name)) if key]
+        for key in keys:
+            index = self._find(_COUNTRY_KEY + key)
+            if index is not None:
+                place = self._place(index)
+                break
+        else:
+            if keys:
+                place = self._lookup(_COUNTRY_KEY, keys[0])
+        self._countries[name] = place
+        return place
+
+    def city(self, name: str, country: Optional[str] = None) -> Optional[Place]:
+        """The city called name, in country if given. Returns None rather than a namesake elsewhere.
+
+        Without a country the first listed city of that name is returned; a
+        country that is not in the gazetteer matches no city at all.
+        """
+        memo_key = (name, country)
+        if memo_key in self._cities:
+            return self._cities[memo_key]
+        place = None
+        key = normalize(name)
+        if key and country:
+            country_place = self.country(country)
+            if country_place is not None:
+                place = self._lookup(_CITY_KEY, key, _CODE_SEPARATOR + country_place.country_code)
+        elif key:
+            place = self._lookup(_CITY_KEY, key)
+        self._cities[memo_key] = place
+        return place
+
+
+def build(source: Path = SOURCE_PATH, target: Path = DATA_PATH) -> Tuple[int, int]:
+    """Compiles the tab-separated gazetteer source. Returns the number of places and keys."""
+    places: List[Tuple[int, int, bytes, int, str]] = []
+    keys: Dict[str, int] = {}
+    with open(source, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            kind_name, code, name, lat, lon = fields[:5]
+            kind = COUNTRY if kind_name == "country" else CITY
+            index = len(places)
+            places.append((round(float(lat) * _SCALE), round(float(lon) * _SCALE), code.encode("ascii"), kind, name))
+            spellings = [name] + [alias for alias in (fields[5] if len(fields) > 5 else "").split(";") if alias]
+            if kind == COUNTRY:
+                place_keys = [_COUNTRY_KEY + normalize(s) for s in spellings + [code]]
+                unique = place_keys
+            else:
+                unique = [_CITY_KEY + normalize(s) + _CODE_SEPARATOR + code for s in spellings]
+                place_keys = unique + [_CITY_KEY + normalize(s) for s in spellings]
+            for key in place_keys:
+                owner = keys.setdefault(key, index)
+                if owner != index and key in unique and places[owner][2] != places[index][2]:
+                    logger.warning(f"Line {line_number}: {key[1:]!r} already names {places[owner][4]}")
+
+    strings = bytearray()
+    offsets: Dict[str, int] = {}
+
+    def intern(text: str) -> Tuple[int, int]:
+        encoded = text.encode("utf-8")
+        if text not in offsets:
+            offsets[text] = len(strings)
+            strings.extend(encoded)
+        return offsets[text], len(encoded)
+
+    place_records = b"".join(_PLACE.pack(lat, lon, code, kind, *intern(name)) for lat, lon, code, kind, name in places)
+    ordered = sorted(keys.items(), key=lambda item: item[0].encode("utf-8"))
+    key_records = b"".join(_KEY.pack(*intern(key), index) for key, index in ordered)
+    strings_offset = _HEADER.size + len(place_records) + len(key_records)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(places), len(ordered), strings_offset)
+    Path(target).write_bytes(header + place_records + key_records + bytes(strings))
+    return len(places), len(ordered)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    lookup_parser = commands.add_parser("lookup", help="Resolve a country, or a city with --country")
+    lookup_parser.add_argument("name")
+    lookup_parser.add_argument("--country", help="Look name up as a city in this country")
+    lookup_parser.add_argument("--city", action="store_true", help="Look name up as a city in any country")
+    commands.add_parser("build", help=f"Compile {SOURCE_PATH.name} into {DATA_PATH.name}")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "build":
+        places, keys = build()
+        print(f"Wrote {DATA_PATH} with {places} places and {keys} names")
+        return
+    gazetteer = Gazetteer()
+    if args.country or args.city:
+        place = gazetteer.city(args.name, args.country)
+    else:
+        place = gazetteer.country(args.name)
+    if place is None:
+        print(f"{args.name}: not found")
+    else:
+        print(f"{place.name} ({place.country_code}): {place.lat:.4f}, {place.lon:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+from . import instrumentation
+from .aggregates import add_fingerprints, version_fingerprint
+from .layout import is_trip_folder_name
+from .locks import DeferredFlush, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIRNAME = ".index"
+INDEX_FILENAME = "trips.json"
+INDEX_VERSION = 2
+
+
+class TripIndex:
+    """Persistent map of trip id -> folder name, metadata mtime, version and sort key.
+
+    The index lives in its own sub-directory so that rewriting it does not
+    touch the mtime of the data directory, which is what we use to notice
+    folders created, renamed or removed outside of the app.
+
+    The index is shared between threads. With a flush_delay, changes are
+    written to disk at most once per delay instead of on every save; an
+    index on disk that lags behind is harmless, since lookups re-check
+    metadata mtimes and refresh() picks up added and removed folders.
+
+    fingerprint is the store_fingerprint of the indexed trips, kept up to
+    date with every change, so checking the analytics aggregates against
+    the folders costs no metadata reads.
+    """
+
+    def __init__(self, base_path: Path, flush_delay: float = 0.0):
+        self.base_path = Path(base_path)
+        self.flush_delay = flush_delay
+        self.path = self.base_path / INDEX_DIRNAME / INDEX_FILENAME
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._folders: Dict[str, str] = {}  # folder name -> trip id
+        self._order: Optional[List[Tuple[str, str]]] = None  # (start_date, id) ascending
+        self.base_mtime: Optional[int] = None
+        self.fingerprint = 0
+        self._batch_depth = 0
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._deferred = DeferredFlush(self.flush, flush_delay)
+        if not self._load():
+            self.rebuild()
+
+    def _load(self) -> bool:
+        """Loads the index from disk. Returns False if it is missing or corrupt."""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                return False
+            self.entries = {}
+            self._folders = {}
+            self._order = None
+            self.fingerprint = 0
+            for trip_id, entry in data["entries"].items():
+                self._set(trip_id, entry)
+            self.base_mtime = data.get("base_mtime")
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Trip index at {self.path} is corrupt, rebuilding: {e}")
+            return False
+
+    def _set(self, trip_id: str, entry: Dict[str, Any]):
+        old = self.entries.get(trip_id)
+        if old is not None:
+            self._forget(trip_id, old)
+            if self._folders.get(old["folder"]) == trip_id:
+                del self._folders[old["folder"]]
+        # A folder holds one trip; drop whatever was indexed there before (e.g. after a merge)
+        previous_owner = self._folders.get(entry["folder"])
+        if previous_owner is not None and previous_owner != trip_id:
+            self._forget(previous_owner, self.entries.pop(previous_owner))
+        self.entries[trip_id] = entry
+        self._folders[entry["folder"]] = trip_id
+        self.fingerprint = add_fingerprints(self.fingerprint, version_fingerprint(trip_id, entry["version"]))
+        self._order = None
+
+    def _drop(self, trip_id: str):
+        entry = self.entries.pop(trip_id, None)
+        if entry is not None:
+            self._forget(trip_id, entry)
+            if self._folders.get(entry["folder"]) == trip_id:
+                del self._folders[entry["folder"]]
+        self._order = None
+
+    def _forget(self, trip_id: str, entry: Dict[str, Any]):
+        self.fingerprint = add_fingerprints(self.fingerprint, -version_fingerprint(trip_id, entry["version"]))
+
+    @contextmanager
+    def batch(self):
+        """Defers writing the index to disk, and rescanning the directory, until the outermost batch finishes."""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._refresh()
+                done = self._batch_depth == 0 and self._dirty
+            if done:
+                self.save()
+
+    def save(self):
+        """Marks the index changed and writes it to disk, now or after flush_delay (after the outermost batch())."""
+        with self._lock:
+            self._dirty = True
+            if self._batch_depth:
+                return
+            if self.flush_delay > 0:
+                self._deferred.schedule()
+                return
+        self.flush()
+
+    def flush(self):
+        """Atomically writes pending changes to disk."""
+        with self._lock:
+            self._deferred.cancel()
+            if not self._dirty:
+                return
+            self._dirty = False
+            # Entries are replaced, never mutated, so a shallow copy is a consistent snapshot
+            data = {"version": INDEX_VERSION, "base_mtime": self.base_mtime, "entries": dict(self.entries)}
+            # Taken before releasing _lock so snapshots reach the disk in the order they were taken
+            self._write_lock.acquire()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with instrumentation.span("index.save"):
+                write_json_atomic(self.path, data)
+        finally:
+            self._write_lock.release()
+
+    def _base_mtime(self) -> Optional[int]:
+        instrumentation.count("fs.stat")
+        try:
+            return self.base_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read_entry(self, folder_name: str) -> Optional[Dict[str, Any]]:
+        """Reads a folder's metadata into an index entry (plus its id), or None if it is not a trip."""
+        metadata_path = self.base_path / folder_name / "metadata.json"
+        try:
+            mtime = metadata_path.stat().st_mtime_ns
+            instrumentation.count("fs.open")
+            with open(metadata_path, 'r') as f:
+                data = json.load(f)
+            return {
+                "id": data["id"],
+                "folder": folder_name,
+                "mtime": mtime,
+                "start_date": data["start_date"],
+                "version": data.get("version", 0),
+            }
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to index trip folder {folder_name}: {e}")
+            return None
+
+    def rebuild(self):
+        """Rebuilds the whole index by reading every trip folder."""
+        with self._lock:
+            self._rebuild()
+        self.save()
+
+    def _rebuild(self):
+        self.entries = {}
+        self._folders = {}
+        self._order = None
+        self.fingerprint = 0
+        self.base_mtime = self._base_mtime()
+        if self.base_path.exists():
+            for folder in self.base_path.iterdir():
+                if folder.is_dir() and is_trip_folder_name(folder.name):
+                    entry = self._read_entry(folder.name)
+                    if entry:
+                        self._set(entry.pop("id"), entry)
+
+    def refresh(self):
+        """Picks up folders added or removed outside of this index, if the data directory changed."""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self, force: bool = False):
+        if self._batch_depth and not force:
+            # Every put or remove in a batch moves the directory mtime; rescan once when it ends
+            return
+        current_mtime = self._base_mtime()
+        if current_mtime == self.base_mtime and not force:
+            return
+
+        while True:
+            present_folders = {
+                entry.name for entry in os.scandir(self.base_path)
+                if entry.is_dir() and is_trip_folder_name(entry.name)
+            }
+            for folder_name in set(self._folders) - present_folders:
+                self._drop(self._folders[folder_name])
+            for folder_name in present_folders - set(self._folders):
+                entry = self._read_entry(folder_name)
+                if entry:
+                    self._set(entry.pop("id"), entry)
+            # A listing taken while another process renames a folder can miss it under both names
+            scanned_mtime, current_mtime = current_mtime, self._base_mtime()
+            if current_mtime == scanned_mtime:
+                break
+
+        self.base_mtime = current_mtime
+        self.save()
+
+    def lookup(self, trip_id: str) -> Optional[str]:
+        """Returns the folder name holding the given trip, or None."""
+        with self._lock:
+            return self._lookup(trip_id)
+
+    def _lookup(self, trip_id: str, rescanned_at: Optional[int] = None) -> Optional[str]:
+        self._refresh()
+        entry = self.entries.get(trip_id)
+        if entry is None:
+            return None
+
+        folder_name = entry["folder"]
+        instrumentation.count("fs.stat")
+        try:
+            mtime = (self.base_path / folder_name / "metadata.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime != entry["mtime"]:
+            # Metadata was rewritten (or removed) since we indexed it; re-read that one folder.
+            fresh = self._read_entry(folder_name)
+            fresh_id = fresh.pop("id") if fresh else None
+            if fresh_id != trip_id:
+                self._drop(trip_id)
+            if fresh_id is not None:
+                self._set(fresh_id, fresh)
+            self.save()
+            if fresh_id != trip_id:
+                if rescanned_at is not None and rescanned_at == self._base_mtime():
+                    return None
+                # Another process may have just renamed the trip's folder; look for it before giving up,
+                # and again for as long as the data directory keeps changing under us
+                self._refresh(force=True)
+                return self._lookup(trip_id, rescanned_at=self.base_mtime)
+        return folder_name
+
+    def indexed_folder(self, trip_id: str) -> Optional[str]:
+        """The folder recorded for a trip, without checking the data directory."""
+        entry = self.entries.get(trip_id)
+        return entry["folder"] if entry else None
+
+    def sort_keys(self) -> List[Tuple[str, str]]:
+        """Returns (start_date, id) for every indexed trip in ascending order (cached until the index changes)."""
+        with self._lock:
+            self._refresh()
+            if self._order is None:
+                self._order = sorted((entry["start_date"], trip_id) for trip_id, entry in self.entries.items())
+            return self._order
+
+    def put(self, trip_id: str, folder_name: str, start_date: str, version: int):
+        """Records a trip that was just written to folder_name."""
+        metadata_path = self.base_path / folder_name / "metadata.json"
+        entry = {
+            "folder": folder_name,
+            "mtime": metadata_path.stat().st_mtime_ns,
+            "start_date": start_date,
+            "version": version,
+        }
+        with self._lock:
+            self._set(trip_id, entry)
+            self.save()
+
+    def remove(self, trip_id: str):
+        """Forgets a trip that was just deleted."""
+        with self._lock:
+            self._drop(trip_id)
+            self.save()
+
+    @contextmanager
+    def changing_directory(self):
+        """Wraps a folder creation, rename or removal of our own, recorded with put() or remove() afterwards.
+
+        If the index was up to date with the data directory before, the new
+        directory mtime is adopted instead of rescanning every folder.
+        """
+        before = self._base_mtime()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if before is not None and before == self.base_mtime:
+                    self.base_mtime = self._base_mtime()
+                    self.save()
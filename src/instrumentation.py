@@ -0,0 +1,145 @@
+"""Opt-in timers and counters for hot paths.
+
+    from . import instrumentation
+    with instrumentation.span("manager.scan_trips", log=True):
+        ...
+    instrumentation.count("fs.open")
+
+Profiling is off unless TRAVELLOG_PROFILE=1 is set or enable() is called.
+While it is off, span() returns one shared no-op context manager and
+count() returns after a flag check, so the hooks can stay in per-file loops
+(guard any argument that is costly to compute with `if instrumentation.enabled`).
+While it is on, totals accumulate in a process-wide recorder. Take a
+snapshot() before some work and call since() afterwards for a breakdown.
+Spans opened with log=True also write one JSON line each to this module's
+logger at DEBUG level.
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+enabled = os.environ.get("TRAVELLOG_PROFILE", "0") not in ("", "0")
+
+# name -> [calls, seconds]
+_spans: Dict[str, list] = {}
+_counters: Dict[str, int] = {}
+_lock = threading.Lock()
+
+Snapshot = Tuple[float, Dict[str, Tuple[int, float]], Dict[str, int]]
+
+
+def enable(flag: bool = True):
+    global enabled
+    enabled = flag
+
+
+def count(name: str, n: int = 1):
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def record(name: str, seconds: float):
+    """Adds one timed call to the totals for name."""
+    with _lock:
+        totals = _spans.get(name)
+        if totals is None:
+            _spans[name] = [1, seconds]
+        else:
+            totals[0] += 1
+            totals[1] += seconds
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def lap(self, name: str):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "log", "start")
+
+    def __init__(self, name: str, log: bool):
+        self.name = name
+        self.log = log
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        seconds = time.perf_counter() - self.start
+        record(self.name, seconds)
+        if self.log and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({"span": self.name, "ms": round(seconds * 1000, 3), "ok": exc_type is None}))
+        return False
+
+
+def span(name: str, log: bool = False):
+    """Times the enclosed block under name."""
+    return _Span(name, log) if enabled else _NULL
+
+
+class _Stopwatch:
+    """Records the time between consecutive lap() calls, for timing code that is not one block."""
+    __slots__ = ("prefix", "last")
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.last = time.perf_counter()
+
+    def lap(self, name: str):
+        now = time.perf_counter()
+        record(f"{self.prefix}.{name}", now - self.last)
+        self.last = now
+
+
+def stopwatch(prefix: str):
+    return _Stopwatch(prefix) if enabled else _NULL
+
+
+def snapshot() -> Snapshot:
+    with _lock:
+        return time.perf_counter(), {k: (v[0], v[1]) for k, v in _spans.items()}, dict(_counters)
+
+
+def since(start: Snapshot) -> Dict[str, Any]:
+    """What was recorded (by any thread) since start: wall time, spans and counters."""
+    started, spans, counters = start
+    now, current_spans, current_counters = snapshot()
+    span_delta = {}
+    for name, (calls, seconds) in current_spans.items():
+        old_calls, old_seconds = spans.get(name, (0, 0.0))
+        if calls > old_calls:
+            span_delta[name] = {"calls": calls - old_calls, "ms": round((seconds - old_seconds) * 1000, 3)}
+    counter_delta = {name: value - counters.get(name, 0) for name, value in current_counters.items()
+                     if value != counters.get(name, 0)}
+    return {"wall_ms": round((now - started) * 1000, 3), "spans": span_delta, "counters": counter_delta}
+
+
+def log_report(event: str, report: Dict[str, Any], level: int = logging.INFO, **fields: Optional[Any]):
+    """Writes a since() report as one JSON log line."""
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event, **fields, **report}))
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
@@ -0,0 +1,215 @@
+"""Overlap-aware travel-day counting.
+
+Trips become half-open [first day, day after last day) intervals of date
+ordinals. Overlapping or nested stays are merged with one sorted sweep. Each
+merged set then gets a per-day prefix-sum array, so questions like "days
+traveled between two dates", "days in the trailing 180-day window" and
+per-country or per-tax-year totals take O(1) each after an O(n log n) build.
+
+Month-precision dates ("2023-05") are resolved according to month_policy:
+
+    SPAN   a month start means the 1st and a month end means the last day
+           of that month, i.e. the longest the trip could have lasted (default)
+    FIRST  both mean the 1st of the month, which is what get_stats has always
+           assumed
+
+TravelCalendar.uncertain_days reports how many of the counted days come
+only from month-precision trips.
+"""
+import calendar
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from .dates import MONTH, parse_trip_date
+from .models import Trip
+
+SPAN = "span"
+FIRST = "first"
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def month_end_ordinals(ordinals: np.ndarray) -> np.ndarray:
+    """Maps each date ordinal to the ordinal of the last day of its month."""
+    days = (np.asarray(ordinals, dtype=np.int64) - EPOCH_ORDINAL).astype("datetime64[D]")
+    next_month = (days.astype("datetime64[M]") + 1).astype("datetime64[D]")
+    return next_month.astype(np.int64) + EPOCH_ORDINAL - 1
+
+
+def trip_intervals(start: np.ndarray, end: np.ndarray, end_is_month: np.ndarray,
+                   month_policy: str = SPAN, inclusive_end: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """Turns parsed start/end ordinals into half-open [lo, hi) day intervals.
+
+    With inclusive_end the departure day counts as a travel day (as residency
+    rules count it); without it only nights are counted, like get_stats.
+    """
+    start = np.asarray(start, dtype=np.int64)
+    end = np.asarray(end, dtype=np.int64)
+    if month_policy == SPAN:
+        end = np.where(end_is_month, month_end_ordinals(end), end)
+    elif month_policy != FIRST:
+        raise ValueError(f"Unknown month policy: {month_policy!r}")
+    return start, end + 1 if inclusive_end else end
+
+
+def merge_intervals(lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Merges overlapping or touching [lo, hi) intervals; empty ones are dropped."""
+    lo = np.asarray(lo, dtype=np.int64)
+    hi = np.asarray(hi, dtype=np.int64)
+    keep = hi > lo
+    lo, hi = lo[keep], hi[keep]
+    if not len(lo):
+        return lo, hi
+    order = np.argsort(lo, kind="stable")
+    lo, hi = lo[order], hi[order]
+    # Sweep: a new stay begins wherever a trip starts after everything before it has ended
+    reach = np.maximum.accumulate(hi)
+    begins = np.empty(len(lo), dtype=bool)
+    begins[0] = True
+    begins[1:] = lo[1:] > reach[:-1]
+    first = np.flatnonzero(begins)
+    last = np.append(first[1:] - 1, len(lo) - 1)
+    return lo[first], reach[last]
+
+
+def _period_start(year: int, month: int, day: int) -> int:
+    return date(year, month, min(day, calendar.monthrange(year, month)[1])).toordinal()
+
+
+class DayCoverage:
+    """A set of merged stays plus a per-day prefix-sum array over their extent."""
+
+    def __init__(self, lo: np.ndarray, hi: np.ndarray):
+        self.starts, self.ends = merge_intervals(lo, hi)
+        if len(self.starts):
+            self.origin = int(self.starts[0])
+            span = int(self.ends[-1]) - self.origin
+        else:
+            self.origin, span = 0, 0
+        # Stays are disjoint after merging, so each boundary is hit at most once
+        delta = np.zeros(span + 1, dtype=np.int64)
+        delta[self.starts - self.origin] += 1
+        delta[self.ends - self.origin] -= 1
+        self._prefix = np.zeros(span + 1, dtype=np.int64)  # days covered in [origin, origin + i)
+        np.cumsum(np.cumsum(delta[:span]), out=self._prefix[1:])
+        self.span = span
+
+    @property
+    def total(self) -> int:
+        return int(self._prefix[-1])
+
+    def _covered_before(self, ordinal: int) -> int:
+        return int(self._prefix[min(max(ordinal - self.origin, 0), self.span)])
+
+    def count(self, first: Optional[int] = None, last: Optional[int] = None) -> int:
+        """Covered days between two date ordinals, both inclusive (open-ended if None)."""
+        lo = self._covered_before(first) if first is not None else 0
+        hi = self._covered_before(last + 1) if last is not None else self.total
+        return max(0, hi - lo)
+
+    def covers(self, ordinal: int) -> bool:
+        return self.count(ordinal, ordinal) == 1
+
+    def rolling(self, window: int, last: int) -> int:
+        """Covered days in the window of `window` days ending on `last` (inclusive)."""
+        return self.count(last - window + 1, last)
+
+    def rolling_series(self, window: int, first: int, last: int) -> np.ndarray:
+        """rolling(window, d) for every day d from first to last, computed in one pass."""
+        ends = np.arange(first, last + 1, dtype=np.int64) + 1 - self.origin
+        upper = self._prefix[np.clip(ends, 0, self.span)]
+        lower = self._prefix[np.clip(ends - window, 0, self.span)]
+        return upper - lower
+
+    def max_rolling(self, window: int) -> Tuple[int, Optional[int]]:
+        """The most covered days in any window of `window` days, and the first day such a window ends."""
+        if not self.span:
+            return 0, None
+        first, last = self.origin, self.origin + self.span + window - 2
+        series = self.rolling_series(window, first, last)
+        best = int(np.argmax(series))
+        return int(series[best]), first + best
+
+
+class TravelCalendar:
+    """Merged travel days overall, per country, and for day-precision trips only."""
+
+    def __init__(self, lo: np.ndarray, hi: np.ndarray, countries: np.ndarray, exact: np.ndarray):
+        lo, hi = np.asarray(lo, dtype=np.int64), np.asarray(hi, dtype=np.int64)
+        countries, exact = np.asarray(countries, dtype=object), np.asarray(exact, dtype=bool)
+        self.overall = DayCoverage(lo, hi)
+        self.exact = DayCoverage(lo[exact], hi[exact])
+        self.approximate_trips = int((~exact).sum())
+        self.by_country: Dict[str, DayCoverage] = {}
+        if len(countries):
+            names, groups = np.unique(countries.astype(str), return_inverse=True)
+            order = np.argsort(groups, kind="stable")
+            bounds = np.searchsorted(groups[order], np.arange(len(names) + 1))
+            for i, name in enumerate(names):
+                rows = order[bounds[i]:bounds[i + 1]]
+                self.by_country[str(name)] = DayCoverage(lo[rows], hi[rows])
+
+    @classmethod
+    def from_trips(cls, trips: Iterable[Trip], month_policy: str = SPAN,
+                   inclusive_end: bool = True) -> "TravelCalendar":
+        """Builds a calendar from Trip objects; trips with unparsable dates are skipped."""
+        starts, ends, end_is_month, countries, exact = [], [], [], [], []
+        for trip in trips:
+            try:
+                start, start_precision = parse_trip_date(trip.start_date)
+                end, end_precision = parse_trip_date(trip.end_date)
+            except (ValueError, TypeError):
+                continue
+            starts.append(start)
+            ends.append(end)
+            end_is_month.append(end_precision == MONTH)
+            countries.append(trip.country)
+            exact.append(start_precision != MONTH and end_precision != MONTH)
+        lo, hi = trip_intervals(starts, ends, np.array(end_is_month, dtype=bool), month_policy, inclusive_end)
+        return cls(lo, hi, countries, exact)
+
+    def _coverage(self, country: Optional[str]) -> DayCoverage:
+        if country is None:
+            return self.overall
+        return self.by_country.get(country) or DayCoverage(np.empty(0), np.empty(0))
+
+    def days(self, first: Optional[int] = None, last: Optional[int] = None, country: Optional[str] = None) -> int:
+        """Distinct travel days between two date ordinals (inclusive), optionally in one country."""
+        return self._coverage(country).count(first, last)
+
+    def uncertain_days(self, first: Optional[int] = None, last: Optional[int] = None) -> int:
+        """Days counted only because of month-precision trips."""
+        return self.overall.count(first, last) - self.exact.count(first, last)
+
+    def rolling(self, window: int, last: int, country: Optional[str] = None) -> int:
+        return self._coverage(country).rolling(window, last)
+
+    def max_rolling(self, window: int, country: Optional[str] = None) -> Tuple[int, Optional[int]]:
+        return self._coverage(country).max_rolling(window)
+
+    def per_country(self, first: Optional[int] = None, last: Optional[int] = None) -> Dict[str, int]:
+        """Travel days per country in the range, most days first (overlapping countries both count)."""
+        counts = {name: coverage.count(first, last) for name, coverage in self.by_country.items()}
+        return dict(sorted(((k, v) for k, v in counts.items() if v), key=lambda item: item[1], reverse=True))
+
+    def per_period(self, year_start: Tuple[int, int] = (1, 1), country: Optional[str] = None) -> Dict[int, int]:
+        """Travel days per year, where years begin on year_start=(month, day), e.g. (4, 6) for a UK tax year.
+
+        Keys are the calendar year each period starts in. A start day the month
+        lacks in some years (February 29) falls on the month's last day there.
+        """
+        coverage = self._coverage(country)
+        if not coverage.span:
+            return {}
+        month, day = year_start
+        first_year = date.fromordinal(coverage.origin).year - 1
+        last_year = date.fromordinal(coverage.origin + coverage.span - 1).year
+        totals = {}
+        for year in range(first_year, last_year + 1):
+            lo = _period_start(year, month, day)
+            hi = _period_start(year + 1, month, day) - 1
+            days = coverage.count(lo, hi)
+            if days:
+                totals[year] = days
+        return totals
@@ -0,0 +1,237 @@
+"""How trip folders are named inside a filesystem data directory, and migrating between layouts.
+
+    python -m src.layout status trips_data
+    python -m src.layout migrate trips_data --to id      # folders named by trip id, plus by_name/ links
+    python -m src.layout migrate trips_data --to name    # back to date_city_country folders
+
+In the "name" layout (the default, for directories without a .layout
+marker) a trip lives in a folder named after its start date, city and
+country, so editing any of those renames the folder. In the "id" layout
+the folder is named by the trip id and never moves; by_name/ then holds a
+symlink per trip under its readable name, kept up to date from storage
+change events. Stop the app before migrating.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+import logging
+from .events import TripEvent
+from .models import Trip
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_FILENAME = ".layout"
+NAME_LAYOUT = "name"
+ID_LAYOUT = "id"
+LAYOUTS = (NAME_LAYOUT, ID_LAYOUT)
+ALIAS_DIRNAME = "by_name"
+
+# Suffix of a name claimed when another trip already has the same date and place
+COLLISION_SUFFIX = re.compile(r"~\d+$")
+# Trip ids name folders in the id layout, so they may not contain separators or dots
+TRIP_ID = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def readable_name(trip: Trip) -> str:
+    """Folder (or alias) name based on trip date and location."""
+    city = trip.city.strip().replace(" ", "_")
+    country = trip.country.strip().replace(" ", "_")
+    return f"{trip.start_date}_{city}_{country}"
+
+
+def is_safe_trip_id(trip_id: str) -> bool:
+    """Whether a trip id can be used as a folder name inside the data directory."""
+    return isinstance(trip_id, str) and TRIP_ID.fullmatch(trip_id) is not None and trip_id != ALIAS_DIRNAME
+
+
+def name_family(name: str) -> str:
+    """The name a folder or alias was derived from, without its collision suffix."""
+    return COLLISION_SUFFIX.sub("", name)
+
+
+def is_trip_folder_name(name: str) -> bool:
+    """Whether a directory entry in the data directory can be a trip folder (not hidden, not by_name/)."""
+    return not name.startswith(".") and name != ALIAS_DIRNAME
+
+
+def read_layout(base_path: Path) -> str:
+    try:
+        layout = (Path(base_path) / LAYOUT_FILENAME).read_text().strip()
+    except FileNotFoundError:
+        return NAME_LAYOUT
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown trip folder layout {layout!r} in {base_path}")
+    return layout
+
+
+def write_layout(base_path: Path, layout: str):
+    (Path(base_path) / LAYOUT_FILENAME).write_text(layout + "\n")
+
+
+class AliasView:
+    """by_name/<date_city_country> symlinks to id-named trip folders, for browsing the directory.
+
+    Subscribe handle_event to the storage to keep the links in step with
+    every save and delete. Two trips with the same readable name get
+    name, name~2, ... Where symlinks are not supported the view is skipped.
+    """
+
+    def __init__(self, base_path: Path):
+        self.base_path = Path(base_path)
+        self.path = self.base_path / ALIAS_DIRNAME
+        self.enabled = True
+
+    @staticmethod
+    def _target(trip_id: str) -> str:
+        return os.path.join(os.pardir, trip_id)
+
+    def find(self, name: str, trip_id: str) -> Optional[Path]:
+        """Returns the link for trip_id among name, name~2, ..., or None."""
+        target, n = self._target(trip_id), 1
+        candidate = self.path / name
+        while os.path.lexists(candidate):
+            try:
+                if os.readlink(candidate) == target:
+                    return candidate
+            except OSError:
+                pass
+            n += 1
+            candidate = self.path / f"{name}~{n}"
+        return None
+
+    def link(self, trip: Trip) -> Optional[Path]:
+        """Creates the trip's link unless it exists. Returns the link path."""
+        name = readable_name(trip)
+        existing = self.find(name, trip.id)
+        if existing is not None or not self.enabled:
+            return existing
+        self.path.mkdir(exist_ok=True)
+        candidate, n = self.path / name, 1
+        while True:
+            try:
+                os.symlink(self._target(trip.id), candidate, target_is_directory=True)
+                return candidate
+            except FileExistsError:
+                n += 1
+                candidate = self.path / f"{name}~{n}"
+            except (OSError, NotImplementedError) as e:
+                logger.warning(f"Cannot create {ALIAS_DIRNAME}/ links in {self.base_path} ({e}); skipping them")
+                self.enabled = False
+                return None
+
+    def unlink(self, trip: Trip):
+        existing = self.find(readable_name(trip), trip.id)
+        if existing is not None:
+            existing.unlink()
+
+    def handle_event(self, event: TripEvent):
+        """Storage listener: moves the link when a trip's readable name changes."""
+        previous, trip = event.previous, event.trip
+        if previous is not None and (trip is None or readable_name(previous) != readable_name(trip)):
+            self.unlink(previous)
+        if trip is not None:
+            self.link(trip)
+
+    def rebuild(self, trips: Iterable[Trip]) -> int:
+        """Recreates the whole view. Returns the number of links."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.enabled = True
+        return sum(1 for trip in trips if self.link(trip) is not None)
+
+
+def _read_trip(folder: Path) -> Optional[Trip]:
+    try:
+        with open(folder / "metadata.json", 'r') as f:
+            return Trip.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to load trip from {folder}: {e}")
+        return None
+
+
+def _claim(base_path: Path, name: str) -> str:
+    candidate, n = name, 1
+    while (base_path / candidate).exists():
+        n += 1
+        candidate = f"{name}~{n}"
+    return candidate
+
+
+def migrate_layout(base_path: Path, layout: str) -> Tuple[int, int]:
+    """Renames every trip folder for the given layout and records it. Returns (moved, skipped).
+
+    Folders are renamed whole, so attachments stored inside them move
+    without being copied. Safe to run again after an interruption.
+    """
+    from .manager import TripManager
+
+    base_path = Path(base_path)
+    moved = skipped = 0
+    seen: Dict[str, str] = {}
+    for entry in sorted(os.scandir(base_path), key=lambda e: e.name):
+        if not entry.is_dir(follow_symlinks=False) or not is_trip_folder_name(entry.name):
+            continue
+        trip = _read_trip(Path(entry.path))
+        if trip is None:
+            logger.warning(f"Skipping {entry.name}: no readable metadata.json")
+            skipped += 1
+            continue
+        if trip.id in seen:
+            logger.warning(f"Skipping {entry.name}: trip {trip.id} is already stored in {seen[trip.id]}")
+            skipped += 1
+            continue
+        if layout == ID_LAYOUT:
+            if not is_safe_trip_id(trip.id):
+                logger.warning(f"Skipping {entry.name}: trip id {trip.id!r} is not a safe folder name")
+                skipped += 1
+                continue
+            target = trip.id
+        elif name_family(entry.name) == readable_name(trip):
+            target = entry.name
+        else:
+            target = _claim(base_path, readable_name(trip))
+        if target != entry.name:
+            if (base_path / target).exists():
+                logger.warning(f"Skipping {entry.name}: {target} already exists")
+                skipped += 1
+                continue
+            os.rename(entry.path, base_path / target)
+            moved += 1
+        seen[trip.id] = target
+
+    write_layout(base_path, layout)
+    manager = TripManager(str(base_path), flush_delay=0)
+    manager.index.rebuild()
+    if layout == ID_LAYOUT:
+        # Archived trips have no folder to link to
+        manager.aliases.rebuild(manager._scan_folders())
+    else:
+        shutil.rmtree(base_path / ALIAS_DIRNAME, ignore_errors=True)
+    return moved, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    status_parser = commands.add_parser("status", help="Print the layout of a trips_data directory")
+    status_parser.add_argument("location")
+    migrate_parser = commands.add_parser("migrate", help="Rename trip folders for another layout")
+    migrate_parser.add_argument("location")
+    migrate_parser.add_argument("--to", choices=LAYOUTS, required=True)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "status":
+        print(read_layout(Path(args.location)))
+        return
+    moved, skipped = migrate_layout(Path(args.location), args.to)
+    print(f"Moved {moved} trip folders to the {args.to} layout ({skipped} skipped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Locks and atomic file writes shared by every thread and process working on one data directory.
+
+Locks are fcntl.flock()s on small files, so they also hold between app
+instances sharing a directory. On platforms without fcntl they fall back
+to in-process locks only.
+"""
+import atexit
+import hashlib
+import json
+import os
+import threading
+import uuid
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LOCK_DIRNAME = ".locks"
+STRIPES = 256
+
+# Deferred flushes still waiting for their timer; run when the interpreter exits
+_pending: "weakref.WeakSet[DeferredFlush]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_pending():
+    for deferred in list(_pending):
+        deferred.fire()
+
+
+if hasattr(os, "register_at_fork"):
+    # A forked child would otherwise inherit, and write again, changes its parent has yet to write
+    os.register_at_fork(before=_flush_pending)
+
+
+def write_json_atomic(path: Path, data: Any, **dump_kwargs):
+    """Writes data to a uniquely named temporary file next to path, then renames it over path.
+
+    Readers see either the old or the new file, never a partial one, and
+    concurrent writers never share a temporary file.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, 'x') as f:
+            json.dump(data, f, **dump_kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class FileLock:
+    """An exclusive lock on one file, held by at most one thread in any process at a time.
+
+    Not reentrant: acquiring it again from the thread that holds it deadlocks.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if fcntl is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self._fd = fd
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        if self._fd is not None:
+            fd, self._fd = self._fd, None
+            os.close(fd)  # closing the descriptor drops the flock
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+
+class KeyLocks:
+    """Locks by name (trip id, folder name) without one lock file per name.
+
+    Names hash onto a fixed number of striped FileLocks. Two names on the
+    same stripe just wait for each other. hold() takes its stripes in
+    ascending order and skips stripes the calling thread already holds, so
+    nested and multi-key holds on one KeyLocks cannot deadlock. When using
+    several KeyLocks together, always take them in the same order.
+    """
+
+    def __init__(self, root: Path, stripes: int = STRIPES):
+        self.root = Path(root)
+        self.stripes = stripes
+        self._locks: Dict[int, FileLock] = {}
+        self._guard = threading.Lock()
+        self._held = threading.local()
+
+    def _stripe(self, key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=4).digest(), "big") % self.stripes
+
+    def _lock(self, stripe: int) -> FileLock:
+        with self._guard:
+            lock = self._locks.get(stripe)
+            if lock is None:
+                lock = self._locks[stripe] = FileLock(self.root / f"{stripe:03x}.lock")
+            return lock
+
+    @contextmanager
+    def hold(self, *keys: str) -> Iterator[None]:
+        held: Set[int] = getattr(self._held, "stripes", None)
+        if held is None:
+            held = self._held.stripes = set()
+        acquired = []
+        try:
+            for stripe in sorted({self._stripe(key) for key in keys} - held):
+                self._lock(stripe).acquire()
+                held.add(stripe)
+                acquired.append(stripe)
+            yield
+        finally:
+            for stripe in reversed(acquired):
+                held.discard(stripe)
+                self._lock(stripe).release()
+
+
+class DeferredFlush:
+    """Runs a flush function once, delay seconds after the first schedule() since it last ran.
+
+    Coalesces many small changes into one write. Flushes still pending
+    when the interpreter exits are run by an atexit hook.
+    """
+
+    def __init__(self, flush: Callable[[], None], delay: float):
+        self._flush = flush
+        self.delay = delay
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def schedule(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.fire)
+                self._timer.daemon = True
+                self._timer.start()
+                _pending.add(self)
+
+    def cancel(self):
+        """Forgets a scheduled flush; call at the start of the flush function."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+                _pending.discard(self)
+
+    def fire(self):
+        self.cancel()
+        self._flush()
@@ -1,124 +1,573 @@
+import heapq
 import json
 import os
 import shutil
+import uuid
+from datetime import date
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import BinaryIO, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from .models import Trip
+from .archive import TripArchive, ends_before
+from .aggregates import AGGREGATES_FILENAME, add_fingerprints, store_fingerprint
+from .index import INDEX_DIRNAME, TripIndex
+from .cache import MISSING, ScanCache
+from .blobs import BLOB_DIRNAME, BlobStore
+from .events import ADDED, CHANGED, REMOVED, TripEvent
+from . import instrumentation
+from .layout import (ID_LAYOUT, AliasView, is_safe_trip_id, is_trip_folder_name, name_family, read_layout,
+                     readable_name)
+from .locks import LOCK_DIRNAME, KeyLocks, write_json_atomic
+from .storage import (Cursor, TripConflictError, TripPage, TripStorage, check_version, next_version, page_offset,
+                      shared_blob_references)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class TripManager:
-    def __init__(self, base_path: str):
+TRASH_DIRNAME = ".trash"
+
+
+class TripManager(TripStorage):
+    """Filesystem backend: one folder per trip holding a metadata.json.
+
+    Folders are named by date and place, or by trip id in the id layout
+    (see src.layout), where edits never move a folder.
+
+    Writers lock the trip they change (by id) and the folder names they
+    touch, so edits to different trips proceed in parallel, across threads
+    and across processes sharing the directory. Readers take no locks:
+    metadata.json is replaced atomically, so a reader sees either the old
+    or the new version of a trip.
+
+    Trips moved to cold storage by compact() have no folder; their metadata
+    comes from the archive catalog and their attachments are read straight
+    out of the archive (see src.archive). Saving one moves it back into a
+    folder.
+    """
+
+    def __init__(self, base_path: str, scan_workers: int = 1, flush_delay: float = 1.0):
+        super().__init__()
         self.base_path = Path(base_path)
+        self.scan_workers = scan_workers
         self.base_path.mkdir(parents=True, exist_ok=True)
+        # Index and aggregates rewrite a whole file per change, so changes are written at most once per flush_delay
+        self.index = TripIndex(self.base_path, flush_delay=flush_delay)
+        self.cache = ScanCache()
+        self.blobs = BlobStore(self.base_path / BLOB_DIRNAME)
+        self.archive = TripArchive(self.base_path)
+        self._merged_keys: Optional[Tuple[list, list, List[Tuple[str, str]]]] = None
+        # Always taken in this order: trip id first, then folder names
+        self.trip_locks = KeyLocks(self.base_path / LOCK_DIRNAME / "trips")
+        self.folder_locks = KeyLocks(self.base_path / LOCK_DIRNAME / "folders")
+        self.layout = read_layout(self.base_path)
+        self.aliases = AliasView(self.base_path)
+        if self.layout == ID_LAYOUT:
+            self.subscribe(self.aliases.handle_event)
+        # Set while a TripWatcher keeps the scan cache current; cached scans then skip the stat pass
+        self.watching = False
+        self._attach_aggregates(self.base_path / INDEX_DIRNAME / AGGREGATES_FILENAME, flush_delay)
 
     def _get_folder_name(self, trip: Trip) -> str:
-        """Generates a folder name based on trip date and location."""
-        city = trip.city.strip().replace(" ", "_")
-        country = trip.country.strip().replace(" ", "_")
-        return f"{trip.start_date}_{city}_{country}"
-
-    def scan_trips(self) -> List[Trip]:
-        """Scans the base_path for trip folders and loads metadata."""
-        trips = []
+        """The folder a trip belongs in: its id, or its date and location in the name layout."""
+        if self.layout == ID_LAYOUT:
+            return trip.id
+        return readable_name(trip)
+
+    def _load_trip(self, folder: Path) -> Optional[Trip]:
+        """Loads a single trip folder's metadata, logging (not raising) on bad files."""
+        try:
+            with instrumentation.span("manager.read_metadata"):
+                with open(folder / "metadata.json", 'rb') as f:
+                    data = f.read()
+            if instrumentation.enabled:
+                instrumentation.count("fs.open")
+                instrumentation.count("fs.bytes_read", len(data))
+            with instrumentation.span("manager.decode_metadata"):
+                return Trip.from_dict(json.loads(data))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            instrumentation.count("manager.parse_failures")
+            logger.warning(f"Failed to load trip from {folder}: {e}")
+            return None
+
+    def _load_trips(self, folders: List[Path], workers: Optional[int] = None) -> List[Optional[Trip]]:
+        """Loads several folders, concurrently when more than one worker is configured."""
+        workers = workers or self.scan_workers
+        if workers <= 1 or len(folders) <= 1:
+            return [self._load_trip(folder) for folder in folders]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self._load_trip, folders))
+
+    def scan_trips(self, use_cache: bool = False, workers: Optional[int] = None) -> List[Trip]:
+        """Scans the base_path for trip folders and loads metadata.
+
+        With use_cache, only folders whose metadata.json changed since the
+        previous cached scan are re-read; the rest cost a single stat.
+        workers overrides the scan_workers thread count for this call.
+        """
+        if use_cache:
+            with instrumentation.span("manager.scan_trips_cached", log=True):
+                return self._scan_cached(workers)
+
+        with instrumentation.span("manager.scan_trips", log=True):
+            return self._with_archived(self._scan_folders(workers))
+
+    def _scan_folders(self, workers: Optional[int] = None) -> List[Trip]:
+        """Loads every trip folder (leaving out archived trips), by start date descending."""
         if not self.base_path.exists():
-            return trips
+            return []
+        with instrumentation.span("manager.list_folders"):
+            folders = [
+                folder for folder in self.base_path.iterdir()
+                if folder.is_dir() and is_trip_folder_name(folder.name)
+            ]
+        instrumentation.count("fs.listdir")
+        trips = [trip for trip in self._load_trips(folders, workers) if trip]
 
-        for folder in self.base_path.iterdir():
-            if folder.is_dir():
-                metadata_path = folder / "metadata.json"
-                if metadata_path.exists():
-                    try:
-                        with open(metadata_path, 'r') as f:
-                            data = json.load(f)
-                            trips.append(Trip.from_dict(data))
-                    except Exception as e:
-                        logger.warning(f"Failed to load trip from {folder}: {e}")
-        
         # Sort trips by start date descending
         trips.sort(key=lambda x: x.start_date, reverse=True)
         return trips
 
+    def _with_archived(self, trips: List[Trip]) -> List[Trip]:
+        """Merges archived trips into trips sorted by start date descending. A trip with a folder wins."""
+        archived = self.archive.trips()
+        if not archived:
+            return trips
+        live_ids = {trip.id for trip in trips}
+        return list(heapq.merge(trips, (trip for trip in archived if trip.id not in live_ids),
+                                key=lambda x: x.start_date, reverse=True))
+
+    def _store_fingerprint(self) -> int:
+        # The index fingerprints the trips with a folder; a trip with a folder wins over its archived copy
+        self.index.refresh()
+        archived = (trip for trip in self.archive.trips() if trip.id not in self.index.entries)
+        return add_fingerprints(self.index.fingerprint, store_fingerprint(archived))
+
+    def iter_trips(self) -> Iterator[Trip]:
+        """Yields trips folder by folder without loading the whole catalog, then the archived ones."""
+        if not self.base_path.exists():
+            return
+        seen = set()
+        for entry in os.scandir(self.base_path):
+            if entry.is_dir() and is_trip_folder_name(entry.name):
+                trip = self._load_trip(Path(entry.path))
+                if trip:
+                    seen.add(trip.id)
+                    yield trip
+        for trip in self.archive.trips():
+            if trip.id not in seen:
+                yield self.archive.get(trip.id) or trip
+
+    @property
+    def generation(self) -> Hashable:
+        return (self.cache.generation, self.archive.generation)
+
+    def _signature(self, folder_name: str) -> Tuple[int, int, int]:
+        """Stat signature of a folder's metadata.json. Raises FileNotFoundError if it has none."""
+        if instrumentation.enabled:
+            instrumentation.count("fs.stat")
+        st = os.stat(os.path.join(self.base_path, folder_name, "metadata.json"))
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _signature_or_none(self, folder_name: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            return self._signature(folder_name)
+        except FileNotFoundError:
+            return None
+
+    def _scan_cached(self, workers: Optional[int] = None) -> List[Trip]:
+        if self.watching and self.cache.primed:
+            # The watcher applies every change to the cache as it happens
+            return self._with_archived(self.cache.sorted_trips())
+        if not self.base_path.exists():
+            self.cache.invalidate()
+            return []
+
+        present = []
+        stale = []
+        with instrumentation.span("manager.stat_folders"):
+            instrumentation.count("fs.listdir")
+            for entry in os.scandir(self.base_path):
+                if not is_trip_folder_name(entry.name) or not entry.is_dir():
+                    continue
+                try:
+                    signature = self._signature(entry.name)
+                except FileNotFoundError:
+                    continue
+                present.append(entry.name)
+                if self.cache.get(entry.name, signature) is MISSING:
+                    stale.append((entry.name, signature))
+        instrumentation.count("manager.cache_misses", len(stale))
+
+        loaded = self._load_trips([self.base_path / name for name, _ in stale], workers)
+        for (name, signature), trip in zip(stale, loaded):
+            self.cache.put(name, signature, trip)
+
+        self.cache.retain(present)
+        self.cache.primed = True
+        return self._with_archived(self.cache.sorted_trips())
+
+    def sync_folder(self, folder_name: str) -> List[TripEvent]:
+        """Reconciles one folder changed outside this manager and publishes what changed.
+
+        Compares the folder's metadata with the scan cache, updates the cache
+        and id index, and publishes added/changed/removed events. Returns them.
+        A trip whose folder was renamed is reported as changed, not removed.
+        """
+        # One stat decides, without the cross-process lock, whether the folder changed at all
+        if self.cache.matches(folder_name, self._signature_or_none(folder_name)):
+            return []
+        # Writers hold this lock until cache and index match the folder, so their own writes sync as no-ops
+        with self.folder_locks.hold(name_family(folder_name)):
+            previous = self.cache.peek(folder_name)
+            signature = self._signature_or_none(folder_name)
+
+            current = None
+            if signature is not None:
+                if self.cache.get(folder_name, signature) is not MISSING:
+                    return []
+                current = self._load_trip(self.base_path / folder_name)
+                self.cache.put(folder_name, signature, current)
+            else:
+                self.cache.invalidate(folder_name)
+
+            events = []
+            if previous is not None and (current is None or current.id != previous.id):
+                # Unless the trip has moved to another folder, which was synced first
+                if self.index.indexed_folder(previous.id) in (folder_name, None):
+                    self.index.remove(previous.id)
+                    # A folder removed by compaction: the trip still exists, in the archive
+                    if current is not None or self.archive.lookup(previous.id) is None:
+                        events.append(TripEvent(REMOVED, previous.id, None, previous, external=True))
+                previous = None
+            if current is not None:
+                if previous is None:
+                    previous = self._moved_from(current.id, folder_name)
+                self.index.put(current.id, folder_name, current.start_date, current.version)
+                events.append(TripEvent(CHANGED if previous else ADDED, current.id, current, previous, external=True))
+            for event in events:
+                self._publish(event)
+            return events
+
+    def _moved_from(self, trip_id: str, folder_name: str) -> Optional[Trip]:
+        """The cached trip from the folder trip_id was renamed from, forgetting that folder; None if it was not moved."""
+        old_folder_name = self.index.indexed_folder(trip_id)
+        if old_folder_name in (folder_name, None) or self._signature_or_none(old_folder_name) is not None:
+            return None
+        previous = self.cache.peek(old_folder_name)
+        self.cache.invalidate(old_folder_name)
+        return previous if previous is not None and previous.id == trip_id else None
+
+    def sync_all(self) -> List[TripEvent]:
+        """Reconciles every folder (e.g. after the watcher lost events). Costs one stat per folder."""
+        present = {
+            entry.name for entry in os.scandir(self.base_path)
+            if entry.is_dir() and is_trip_folder_name(entry.name)
+        }
+        events = []
+        for folder_name in sorted(present | set(self.cache.folders())):
+            events.extend(self.sync_folder(folder_name))
+        return events
+
+    def flush(self):
+        """Writes index and aggregates changes still waiting out the flush_delay."""
+        self.index.flush()
+        self.aggregates.flush()
+
+    def invalidate_cache(self, folder_name: Optional[str] = None):
+        """Drops cached scan results for one folder, or all of them."""
+        self.cache.invalidate(folder_name)
+
     def save_trip(self, trip: Trip, uploaded_files: List = []) -> bool:
         """Saves a trip and its attachments to the file system. Handles renaming if date/location changed."""
+        with instrumentation.span("manager.save_trip", log=True):
+            return self._save_trip(trip, uploaded_files)
+
+    def _claim_folder(self, folder_name: str, trip_id: str) -> str:
+        """Returns folder_name, or the first free folder_name~N if another trip already lives there."""
+        candidate, n = folder_name, 1
+        while True:
+            path = self.base_path / candidate
+            if not path.exists():
+                return candidate
+            occupant = self._load_trip(path)
+            if occupant is not None and occupant.id == trip_id:
+                return candidate
+            n += 1
+            candidate = f"{folder_name}~{n}"
+
+    def _create_folder(self, trip_dir: Path, trip: Trip):
+        """Creates a trip folder with its metadata in place, so nobody sees it empty."""
+        staging = self.base_path / f".{trip_dir.name}.{uuid.uuid4().hex}.tmp"
+        with self.index.changing_directory():
+            try:
+                staging.mkdir()
+                write_json_atomic(staging / "metadata.json", trip.to_dict(), indent=2)
+                os.rename(staging, trip_dir)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+    def _save_trip(self, trip: Trip, uploaded_files: List, check: bool = True) -> bool:
+        if self.layout == ID_LAYOUT and not is_safe_trip_id(trip.id):
+            # The id is the folder name in this layout
+            logger.error(f"Refusing to save trip with unsafe id {trip.id!r}")
+            return False
         try:
-            # Check if we are updating an existing trip that might need a folder rename
-            existing_trip = self.get_trip_by_id(trip.id)
-            if existing_trip:
-                old_folder_name = self._get_folder_name(existing_trip)
-                new_folder_name = self._get_folder_name(trip)
-                
-                if old_folder_name != new_folder_name:
-                    old_path = self.base_path / old_folder_name
-                    new_path = self.base_path / new_folder_name
-                    if old_path.exists():
-                        # If new path already exists (collision), we might need to be careful.
-                        # For now, we'll just move.
-                        if not new_path.exists():
-                            shutil.move(str(old_path), str(new_path))
-                        else:
-                            # Collision! Just copy data over or merge.
-                            # For now, we'll try to merge.
-                            for item in old_path.iterdir():
-                                dest = new_path / item.name
-                                if not dest.exists():
-                                    shutil.move(str(item), str(dest))
-                            shutil.rmtree(old_path)
-
-            folder_name = self._get_folder_name(trip)
-            trip_dir = self.base_path / folder_name
-            trip_dir.mkdir(parents=True, exist_ok=True)
-
-            # Handle attachments
+            # Attachments stream into the blob store first, deduplicated by content; no lock needed
             new_attachments = []
             for uploaded_file in uploaded_files:
-                file_path = trip_dir / uploaded_file.name
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
+                digest, _ = self.blobs.put(uploaded_file)
+                trip.blobs[uploaded_file.name] = digest
                 if uploaded_file.name not in trip.attachments:
                     new_attachments.append(uploaded_file.name)
-            
-            # Merge with existing attachments
             trip.attachments = list(set(trip.attachments + new_attachments))
 
-            # Save metadata
-            metadata_path = trip_dir / "metadata.json"
-            with open(metadata_path, 'w') as f:
-                json.dump(trip.to_dict(), f, indent=2)
-            
+            with self.trip_locks.hold(trip.id):
+                existing_trip = self.get_trip_by_id(trip.id)
+                if check:
+                    check_version(trip, existing_trip)
+                old_folder_name = self.index.lookup(trip.id) if existing_trip else None
+                archived = existing_trip is not None and old_folder_name is None
+                if archived:
+                    self._unarchive_attachments(trip, {uploaded_file.name for uploaded_file in uploaded_files})
+                family = self._get_folder_name(trip)
+                families = [family] + ([name_family(old_folder_name)] if old_folder_name else [])
+
+                with self.folder_locks.hold(*families):
+                    if old_folder_name and name_family(old_folder_name) == family:
+                        folder_name = old_folder_name
+                    else:
+                        # New trip, or date/location changed: move to a folder no other trip holds
+                        folder_name = self._claim_folder(family, trip.id)
+                    trip_dir = self.base_path / folder_name
+                    if old_folder_name and old_folder_name != folder_name:
+                        with self.index.changing_directory():
+                            os.rename(self.base_path / old_folder_name, trip_dir)
+                        self.cache.invalidate(old_folder_name)
+                    for uploaded_file in uploaded_files:
+                        legacy_path = trip_dir / uploaded_file.name
+                        if legacy_path.exists():
+                            legacy_path.unlink()
+
+                    version, trip.version = trip.version, next_version(trip, existing_trip)
+                    try:
+                        if trip_dir.exists():
+                            write_json_atomic(trip_dir / "metadata.json", trip.to_dict(), indent=2)
+                        else:
+                            self._create_folder(trip_dir, trip)
+                    except Exception:
+                        trip.version = version
+                        raise
+                    self.index.put(trip.id, folder_name, trip.start_date, trip.version)
+                    # A copy: the caller may keep modifying the trip it saved
+                    self.cache.put(folder_name, self._signature(folder_name), trip.copy())
+                if archived:
+                    self.archive.forget([trip.id])
+                self._publish(TripEvent(CHANGED if existing_trip else ADDED, trip.id, trip, existing_trip))
+
             return True
+        except TripConflictError:
+            raise
         except Exception as e:
             logger.error(f"Error saving trip: {e}")
             return False
 
-    def delete_trip(self, trip_id: str) -> bool:
-        """Deletes a trip folder matching the given ID."""
+    def _unarchive_attachments(self, trip: Trip, skip: Iterable[str]):
+        """Copies an archived trip's attachments into the blob store, unless already there."""
+        for filename in trip.attachments:
+            digest = trip.blobs.get(filename)
+            if filename in skip or (digest and self.blobs.path_for(digest).exists()):
+                continue
+            try:
+                with self.archive.open_member(trip.id, filename) as stream:
+                    trip.blobs[filename], _ = self.blobs.put(stream)
+            except FileNotFoundError:
+                logger.warning(f"Attachment {filename} of archived trip {trip.id} is missing from its archive")
+
+    def save_trips(self, trips: Iterable[Trip]) -> int:
+        """Saves a batch of trips, writing the id index and aggregates once for the whole batch.
+
+        Like an import, the batch overwrites whatever is stored without checking versions.
+        """
+        with self.index.batch(), self.aggregates.batch(), instrumentation.span("manager.save_trips", log=True):
+            return sum(1 for trip in trips if self._save_trip(trip, [], check=False))
+
+    def delete_trip(self, trip_id: str, expected_version: Optional[int] = None) -> bool:
+        """Deletes the trip folder matching the given ID."""
+        with instrumentation.span("manager.delete_trip", log=True):
+            return self._delete_trip(trip_id, expected_version)
+
+    def _delete_trip(self, trip_id: str, expected_version: Optional[int]) -> bool:
         try:
-            for folder in self.base_path.iterdir():
-                if folder.is_dir():
-                    metadata_path = folder / "metadata.json"
-                    if metadata_path.exists():
-                        with open(metadata_path, 'r') as f:
-                            data = json.load(f)
-                            if data.get("id") == trip_id:
-                                shutil.rmtree(folder)
-                                return True
-            return False
+            with self.trip_locks.hold(trip_id):
+                folder_name = self.index.lookup(trip_id)
+                if folder_name is None:
+                    return self._delete_archived(trip_id, expected_version)
+                with self.folder_locks.hold(name_family(folder_name)):
+                    previous = self._load_trip(self.base_path / folder_name)
+                    if previous is not None and expected_version is not None and previous.version != expected_version:
+                        raise TripConflictError(trip_id, expected_version, previous.version)
+                    trashed = self._trash(folder_name)
+                    self.index.remove(trip_id)
+                    self.cache.invalidate(folder_name)
+                self._publish(TripEvent(REMOVED, trip_id, None, previous))
+            shutil.rmtree(trashed, ignore_errors=True)
+            return True
+        except TripConflictError:
+            raise
         except Exception as e:
             logger.error(f"Error deleting trip {trip_id}: {e}")
             return False
 
+    def _delete_archived(self, trip_id: str, expected_version: Optional[int]) -> bool:
+        """Drops an archived trip from the catalog. Callers hold the trip lock."""
+        previous = self.archive.get(trip_id)
+        if previous is None:
+            return False
+        if expected_version is not None and previous.version != expected_version:
+            raise TripConflictError(trip_id, expected_version, previous.version)
+        self.archive.forget([trip_id])
+        self._publish(TripEvent(REMOVED, trip_id, None, previous))
+        return True
+
+    def _trash(self, folder_name: str) -> Path:
+        """Moves a trip folder into the trash and returns its new path. Callers hold its folder lock."""
+        # Renaming is atomic and quick; callers run the slow recursive delete after releasing their locks
+        trash_dir = self.base_path / TRASH_DIRNAME
+        trashed = trash_dir / f"{folder_name}-{uuid.uuid4().hex}"
+        with self.index.changing_directory():
+            trash_dir.mkdir(exist_ok=True)
+            os.rename(self.base_path / folder_name, trashed)
+        return trashed
+
+    def compact(self, cutoff: date) -> int:
+        """Moves every trip that ended before cutoff into a new archive file. Returns how many were archived.
+
+        Trips saved or deleted while the archive is being written stay as
+        they are. No change events are published: the trips still exist.
+        """
+        with instrumentation.span("manager.compact", log=True):
+            candidates = [trip for trip in self._scan_folders() if ends_before(trip, cutoff)]
+            if not candidates:
+                return 0
+            name = self.archive.write_archive(candidates, self.open_attachment)
+            self.archive.add(name, candidates)
+
+            archived, changed = 0, []
+            with self.index.batch():
+                for trip in candidates:
+                    with self.trip_locks.hold(trip.id):
+                        folder_name = self.index.lookup(trip.id)
+                        current = self._load_trip(self.base_path / folder_name) if folder_name else None
+                        if current is None or current.version != trip.version:
+                            changed.append(trip.id)
+                            continue
+                        with self.folder_locks.hold(name_family(folder_name)):
+                            trashed = self._trash(folder_name)
+                            self.index.remove(trip.id)
+                            self.cache.invalidate(folder_name)
+                        if self.layout == ID_LAYOUT:
+                            self.aliases.unlink(trip)
+                    shutil.rmtree(trashed, ignore_errors=True)
+                    archived += 1
+            self.archive.forget(changed)
+            self.index.flush()
+            logger.info(f"Archived {archived} trips into {name} ({len(changed)} changed meanwhile and were kept)")
+            return archived
+
     def get_trip_by_id(self, trip_id: str) -> Optional[Trip]:
         """Finds a trip by its unique ID."""
-        for trip in self.scan_trips():
-            if trip.id == trip_id:
-                return trip
-        return None
+        with instrumentation.span("manager.get_trip_by_id"):
+            folder_name = self.index.lookup(trip_id)
+            while folder_name is not None:
+                trip = self._load_trip(self.base_path / folder_name)
+                if trip is not None:
+                    return trip
+                # Another process may have renamed the folder since the lookup, which notices that
+                moved = self.index.lookup(trip_id)
+                if moved == folder_name:
+                    return None
+                folder_name = moved
+            return self.archive.get(trip_id)
+
+    def _sort_keys(self) -> List[Tuple[str, str]]:
+        """(start_date, id) of every trip, with or without a folder, in ascending order."""
+        live = self.index.sort_keys()
+        archived = self.archive.sort_keys()
+        if not archived:
+            return live
+        merged = self._merged_keys
+        # Both key lists are replaced, never modified, when they change
+        if merged is None or merged[0] is not live or merged[1] is not archived:
+            entries = self.index.entries
+            keys = list(heapq.merge(live, (key for key in archived if key[1] not in entries)))
+            self._merged_keys = merged = (live, archived, keys)
+        return merged[2]
+
+    def query_page(self, limit: int = 20, offset: int = 0, after: Optional[Cursor] = None) -> TripPage:
+        """Returns one page of trips by start date descending, reading only that page's metadata."""
+        with instrumentation.span("manager.query_page", log=True):
+            keys = self._sort_keys()
+            start = page_offset(keys, after, offset)
+            end = min(start + limit, len(keys))
+            trips = []
+            for i in range(start, end):
+                _, trip_id = keys[len(keys) - 1 - i]
+                trip = self.get_trip_by_id(trip_id)
+                if trip:
+                    trips.append(trip)
+            next_cursor = keys[len(keys) - end] if end < len(keys) else None
+            return TripPage(trips, len(keys), start, next_cursor)
 
     def get_attachment_path(self, trip: Trip, filename: str) -> Path:
         """Returns the full path to an attachment."""
-        folder_name = self._get_folder_name(trip)
+        digest = trip.blobs.get(filename)
+        if digest:
+            return self.blobs.path_for(digest)
+        # Attachments saved before the blob store live inside the trip folder
+        folder_name = self.index.lookup(trip.id) or self._get_folder_name(trip)
         return self.base_path / folder_name / filename
+
+    def _in_archive(self, trip: Trip, filename: str) -> bool:
+        """Whether an attachment is only available from the trip's archive."""
+        digest = trip.blobs.get(filename)
+        if digest and self.blobs.path_for(digest).exists():
+            return False
+        return self.index.lookup(trip.id) is None and self.archive.lookup(trip.id) is not None
+
+    def open_attachment(self, trip: Trip, filename: str) -> BinaryIO:
+        """Opens an attachment for reading, streaming it out of the archive for archived trips."""
+        if self._in_archive(trip, filename):
+            return self.archive.open_member(trip.id, filename)
+        return super().open_attachment(trip, filename)
+
+    def attachment_key(self, trip: Trip, filename: str) -> Tuple[str, int, int]:
+        if self._in_archive(trip, filename):
+            return self.archive.member_key(trip.id, filename)
+        return super().attachment_key(trip, filename)
+
+    def referenced_blobs(self) -> Set[str]:
+        """Digests of the trips with a folder; archived trips read their attachments from the archive."""
+        referenced = set()
+        for trip in self._scan_folders():
+            referenced.update(trip.blobs.values())
+        return referenced
+
+    def collect_garbage(self) -> int:
+        """Removes unreferenced blobs and archive files, and trip folders left in the trash.
+
+        Blobs still referenced by a SQLite database in the data directory,
+        which shares .blobs/, are kept. Returns the number of blobs removed.
+        """
+        trash_dir = self.base_path / TRASH_DIRNAME
+        if trash_dir.exists():
+            for entry in os.scandir(trash_dir):
+                shutil.rmtree(entry.path, ignore_errors=True)
+        self.archive.collect_garbage()
+        others = shared_blob_references(self.base_path, self.base_path)
+        if others is None:
+            logger.warning("Not collecting blobs: another store in the same directory could not be read")
+            return 0
+        return self.blobs.collect_garbage(self.referenced_blobs() | others)
@@ -0,0 +1,67 @@
+"""Copies every trip and its attachments from one storage backend to another.
+
+    python -m src.migrate trips_data trips_data/trips.db     # folders -> SQLite
+    python -m src.migrate trips_data/trips.db trips_export   # SQLite -> folders
+"""
+import argparse
+import logging
+from typing import BinaryIO, Tuple
+from .models import Trip
+from .storage import TripStorage, open_storage
+
+logger = logging.getLogger(__name__)
+
+
+class AttachmentUpload:
+    """Wraps an attachment file so save_trip can stream it like a Streamlit upload."""
+
+    def __init__(self, name: str, stream: BinaryIO):
+        self.name = name
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._stream.seek(offset, whence)
+
+
+def migrate(source: TripStorage, destination: TripStorage) -> Tuple[int, int]:
+    """Copies all trips from source to destination. Returns (migrated, failed)."""
+    migrated = failed = 0
+    for trip in source.iter_trips():
+        copy = Trip.from_dict(trip.to_dict())
+        copy.blobs = {}
+        # Overwrite whatever the destination holds; versions count saves within one store
+        existing = destination.get_trip_by_id(copy.id)
+        copy.version = existing.version if existing else 0
+        opened = []
+        try:
+            for name in trip.attachments:
+                try:
+                    opened.append(AttachmentUpload(name, source.open_attachment(trip, name)))
+                except FileNotFoundError:
+                    logger.warning(f"Attachment {name} of trip {trip.id} is missing, copying the reference only")
+            if destination.save_trip(copy, opened):
+                migrated += 1
+            else:
+                failed += 1
+        finally:
+            for upload in opened:
+                upload._stream.close()
+    return migrated, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="trips_data directory or SQLite file to read from")
+    parser.add_argument("destination", help="trips_data directory or SQLite file to write to")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    migrated, failed = migrate(open_storage(args.source), open_storage(args.destination))
+    print(f"Migrated {migrated} trips ({failed} failed)")
+
+
+if __name__ == "__main__":
+    main()
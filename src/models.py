@@ -1,7 +1,9 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from datetime import date
-from typing import List, Dict, Any, Optional
+from sys import intern
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 import uuid
+from .dates import parse_trip_date
 
 @dataclass
 class Trip:
@@ -13,6 +15,8 @@ class Trip:
     tags: List[str] = field(default_factory=list)
     attachments: List[str] = field(default_factory=list)
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    blobs: Dict[str, str] = field(default_factory=dict)  # attachment name -> sha256 in the blob store
+    version: int = 0  # bumped on every save; 0 until the trip is first stored
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -23,9 +27,15 @@ class Trip:
             "country": self.country,
             "notes": self.notes,
             "tags": self.tags,
-            "attachments": self.attachments
+            "attachments": self.attachments,
+            "blobs": self.blobs,
+            "version": self.version
         }
 
+    def copy(self) -> 'Trip':
+        """A copy that shares no mutable state with this trip."""
+        return replace(self, tags=list(self.tags), attachments=list(self.attachments), blobs=dict(self.blobs))
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Trip':
         return cls(
@@ -36,5 +46,93 @@ class Trip:
             country=data["country"],
             notes=data.get("notes", ""),
             tags=data.get("tags", []),
-            attachments=data.get("attachments", [])
+            attachments=data.get("attachments", []),
+            blobs=data.get("blobs", {}),
+            version=data.get("version", 0)
         )
+
+
+def _parse_or_none(value: str) -> Tuple[Optional[int], Optional[str]]:
+    try:
+        return parse_trip_date(value)
+    except (ValueError, TypeError):
+        return None, None
+
+
+class CompactTrip:
+    """Memory-lean, read-only counterpart of Trip for large histories.
+
+    Uses __slots__ instead of a per-instance __dict__, interns the heavily
+    repeated country/city/tag strings, stores collections as tuples and
+    parses both dates once on construction. to_dict() produces exactly what
+    Trip.to_dict() would for the same metadata.
+    """
+
+    __slots__ = (
+        "id", "start_date", "end_date", "city", "country", "notes", "tags", "attachments", "_blobs", "version",
+        "start_ordinal", "start_precision", "end_ordinal", "end_precision",
+    )
+
+    def __init__(self, id: str, start_date: str, end_date: str, city: str, country: str,
+                 notes: str = "", tags: Iterable[str] = (), attachments: Iterable[str] = (),
+                 blobs: Optional[Dict[str, str]] = None, version: int = 0):
+        self.id = id
+        self.start_date = intern(start_date)
+        self.end_date = intern(end_date)
+        self.city = intern(city)
+        self.country = intern(country)
+        self.notes = notes
+        self.tags = tuple(intern(tag) for tag in tags)
+        self.attachments = tuple(attachments)
+        self._blobs = tuple(blobs.items()) if blobs else ()
+        self.version = version
+        self.start_ordinal, self.start_precision = _parse_or_none(start_date)
+        self.end_ordinal, self.end_precision = _parse_or_none(end_date)
+
+    @property
+    def blobs(self) -> Dict[str, str]:
+        return dict(self._blobs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "city": self.city,
+            "country": self.country,
+            "notes": self.notes,
+            "tags": list(self.tags),
+            "attachments": list(self.attachments),
+            "blobs": self.blobs,
+            "version": self.version
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'CompactTrip':
+        return cls(
+            id=data["id"],
+            start_date=data["start_date"],
+            end_date=data["end_date"],
+            city=data["city"],
+            country=data["country"],
+            notes=data.get("notes", ""),
+            tags=data.get("tags", []),
+            attachments=data.get("attachments", []),
+            blobs=data.get("blobs", {}),
+            version=data.get("version", 0)
+        )
+
+    @classmethod
+    def from_trip(cls, trip: Trip) -> 'CompactTrip':
+        return cls.from_dict(trip.to_dict())
+
+    def to_trip(self) -> Trip:
+        return Trip.from_dict(self.to_dict())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CompactTrip):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"CompactTrip(id={self.id!r}, start_date={self.start_date!r}, city={self.city!r}, country={self.country!r})"
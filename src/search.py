@@ -0,0 +1,138 @@
+import re
+from bisect import bisect_left, insort
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .dates import parse_trip_date
+from .events import REMOVED, TripEvent
+from .models import Trip
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> Set[str]:
+    return set(TOKEN_RE.findall(text.casefold()))
+
+
+class TripSearchIndex:
+    """In-memory indexes for filtering trips without scanning them.
+
+    Keeps inverted indexes from tag, country and note tokens to trip ids
+    (all case-insensitive) and a sorted (start ordinal, id) list for date
+    range queries. Subscribe it to a storage backend to keep it in sync:
+
+        index = TripSearchIndex(manager.scan_trips())
+        manager.subscribe(index.handle_event)
+    """
+
+    def __init__(self, trips: Iterable[Trip] = ()):
+        self.trips: Dict[str, Trip] = {}
+        self.by_tag: Dict[str, Set[str]] = {}
+        self.by_country: Dict[str, Set[str]] = {}
+        self.by_token: Dict[str, Set[str]] = {}
+        self._dates: List[Tuple[int, str]] = []
+        self._lock = Lock()
+        for trip in trips:
+            self._add(trip)
+
+    @staticmethod
+    def _keys(trip: Trip) -> Tuple[Set[str], Set[str], Set[str], Optional[int]]:
+        try:
+            ordinal, _ = parse_trip_date(trip.start_date)
+        except (ValueError, TypeError):
+            ordinal = None
+        return {t.casefold() for t in trip.tags}, {trip.country.casefold()}, tokenize(trip.notes), ordinal
+
+    def _add(self, trip: Trip):
+        tags, countries, tokens, ordinal = self._keys(trip)
+        for postings, keys in ((self.by_tag, tags), (self.by_country, countries), (self.by_token, tokens)):
+            for key in keys:
+                postings.setdefault(key, set()).add(trip.id)
+        if ordinal is not None:
+            insort(self._dates, (ordinal, trip.id))
+        self.trips[trip.id] = trip
+
+    def _remove(self, trip_id: str):
+        trip = self.trips.pop(trip_id, None)
+        if trip is None:
+            return
+        tags, countries, tokens, ordinal = self._keys(trip)
+        for postings, keys in ((self.by_tag, tags), (self.by_country, countries), (self.by_token, tokens)):
+            for key in keys:
+                ids = postings.get(key)
+                if ids is not None:
+                    ids.discard(trip_id)
+                    if not ids:
+                        del postings[key]
+        if ordinal is not None:
+            i = bisect_left(self._dates, (ordinal, trip_id))
+            if i < len(self._dates) and self._dates[i] == (ordinal, trip_id):
+                del self._dates[i]
+
+    def upsert(self, trip: Trip):
+        with self._lock:
+            self._remove(trip.id)
+            self._add(trip)
+
+    def remove(self, trip_id: str):
+        with self._lock:
+            self._remove(trip_id)
+
+    def rebuild(self, trips: Iterable[Trip]):
+        with self._lock:
+            self.trips, self.by_tag, self.by_country, self.by_token, self._dates = {}, {}, {}, {}, []
+            for trip in trips:
+                self._add(trip)
+
+    def handle_event(self, event: TripEvent):
+        """Storage listener: applies one change incrementally."""
+        if event.kind == REMOVED:
+            self.remove(event.trip_id)
+        elif event.trip is not None:
+            self.upsert(event.trip)
+
+    def tags(self) -> List[str]:
+        with self._lock:
+            return sorted(self.by_tag)
+
+    def countries(self) -> List[str]:
+        """Country names as written on the trips, one spelling per country."""
+        names = {}
+        with self._lock:
+            for trip in self.trips.values():
+                names.setdefault(trip.country.casefold(), trip.country)
+        return sorted(names.values())
+
+    def search(self, text: str = "", tags: Iterable[str] = (), countries: Iterable[str] = (),
+               start_ordinal: Optional[int] = None, end_ordinal: Optional[int] = None) -> List[Trip]:
+        """Returns matching trips by start date descending.
+
+        Every note token in text and every tag must match; any of countries
+        may match; start_ordinal/end_ordinal bound the start date (inclusive).
+        """
+        with self._lock:
+            candidates: List[Set[str]] = []
+            for token in tokenize(text):
+                candidates.append(self.by_token.get(token, set()))
+            for tag in tags:
+                candidates.append(self.by_tag.get(tag.casefold(), set()))
+            countries = list(countries)
+            if countries:
+                candidates.append(set().union(*(self.by_country.get(c.casefold(), set()) for c in countries)))
+            if start_ordinal is not None or end_ordinal is not None:
+                lo = bisect_left(self._dates, (start_ordinal,)) if start_ordinal is not None else 0
+                hi = bisect_left(self._dates, (end_ordinal + 1,)) if end_ordinal is not None else len(self._dates)
+                candidates.append({trip_id for _, trip_id in self._dates[lo:hi]})
+
+            if candidates:
+                candidates.sort(key=len)
+                ids = set(candidates[0])
+                for other in candidates[1:]:
+                    ids &= other
+                    if not ids:
+                        break
+            else:
+                ids = set(self.trips)
+            results = [self.trips[trip_id] for trip_id in ids]
+
+        results.sort(key=lambda x: x.start_date, reverse=True)
+        return results
@@ -0,0 +1,239 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Set
+import logging
+from .models import Trip
+from .aggregates import AGGREGATES_FILENAME, add_fingerprints, version_fingerprint
+from .blobs import BLOB_DIRNAME, BlobStore
+from .events import ADDED, CHANGED, REMOVED, TripEvent
+from .storage import Cursor, TripConflictError, TripPage, TripStorage, check_version, next_version, shared_blob_references
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trips (
+    id TEXT PRIMARY KEY,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    city TEXT NOT NULL,
+    country TEXT NOT NULL,
+    notes TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trips_start_date ON trips (start_date, id);
+CREATE INDEX IF NOT EXISTS trips_country ON trips (country);
+
+CREATE TABLE IF NOT EXISTS trip_tags (
+    trip_id TEXT NOT NULL REFERENCES trips (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (trip_id, tag)
+);
+CREATE INDEX IF NOT EXISTS trip_tags_tag ON trip_tags (tag);
+
+CREATE TABLE IF NOT EXISTS attachments (
+    trip_id TEXT NOT NULL REFERENCES trips (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    digest TEXT,
+    PRIMARY KEY (trip_id, name)
+);
+CREATE INDEX IF NOT EXISTS attachments_digest ON attachments (digest);
+"""
+
+
+class SQLiteTripManager(TripStorage):
+    """Stores trips in a single SQLite database next to a blob store for attachments.
+
+    The full metadata document is kept in the data column so trips round-trip
+    exactly; id, start_date, country and tags are mirrored into indexed
+    columns for queries. Attachments are references (digests) into the same
+    .blobs/ store the filesystem backend uses, so garbage collection counts
+    the references of every store in the directory.
+    """
+
+    def __init__(self, db_path: str):
+        super().__init__()
+        self.db_path = Path(db_path)
+        self.base_path = self.db_path.parent
+        self.base_path.mkdir(parents=True, exist_ok=True)
+        self.blobs = BlobStore(self.base_path / BLOB_DIRNAME)
+        self._local = threading.local()
+        self._writes = 0
+        self._cached = None
+        self._connection().executescript(SCHEMA)
+        # Per database: a folder store or other databases may share this directory
+        self._attach_aggregates(self.db_path.with_name(self.db_path.name + "." + AGGREGATES_FILENAME))
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection (Streamlit serves sessions from several threads)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @property
+    def generation(self) -> Hashable:
+        # data_version moves on commits from other connections, _writes on our own
+        data_version = self._connection().execute("PRAGMA data_version").fetchone()[0]
+        return (data_version, self._writes)
+
+    def scan_trips(self, use_cache: bool = False) -> List[Trip]:
+        """Returns all trips by start date descending, read via the start_date index."""
+        if use_cache:
+            generation = self.generation
+            if self._cached is not None and self._cached[0] == generation:
+                return list(self._cached[1])
+        rows = self._connection().execute("SELECT data FROM trips ORDER BY start_date DESC")
+        trips = [Trip.from_dict(json.loads(data)) for (data,) in rows]
+        if use_cache:
+            self._cached = (generation, trips)
+            return list(trips)
+        return trips
+
+    def query_page(self, limit: int = 20, offset: int = 0, after: Optional[Cursor] = None) -> TripPage:
+        conn = self._connection()
+        total = conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+        if after is None:
+            rows = conn.execute(
+                "SELECT data FROM trips ORDER BY start_date DESC, id DESC LIMIT ? OFFSET ?", (limit, offset))
+        else:
+            offset = conn.execute(
+                "SELECT COUNT(*) FROM trips WHERE (start_date, id) >= (?, ?)", after).fetchone()[0]
+            rows = conn.execute(
+                "SELECT data FROM trips WHERE (start_date, id) < (?, ?) ORDER BY start_date DESC, id DESC LIMIT ?",
+                (*after, limit))
+        trips = [Trip.from_dict(json.loads(data)) for (data,) in rows]
+        next_cursor = (trips[-1].start_date, trips[-1].id) if trips and offset + len(trips) < total else None
+        return TripPage(trips, total, offset, next_cursor)
+
+    def _store_fingerprint(self) -> int:
+        rows = self._connection().execute("SELECT id, COALESCE(json_extract(data, '$.version'), 0) FROM trips")
+        return add_fingerprints(sum(version_fingerprint(trip_id, version) for trip_id, version in rows))
+
+    def iter_trips(self) -> Iterator[Trip]:
+        for (data,) in self._connection().execute("SELECT data FROM trips"):
+            yield Trip.from_dict(json.loads(data))
+
+    def _write_trip(self, conn: sqlite3.Connection, trip: Trip):
+        conn.execute(
+            "INSERT INTO trips (id, start_date, end_date, city, country, notes, data) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET start_date = excluded.start_date, end_date = excluded.end_date, "
+            "city = excluded.city, country = excluded.country, notes = excluded.notes, data = excluded.data",
+            (trip.id, trip.start_date, trip.end_date, trip.city, trip.country, trip.notes, json.dumps(trip.to_dict())),
+        )
+        conn.execute("DELETE FROM trip_tags WHERE trip_id = ?", (trip.id,))
+        conn.executemany("INSERT OR IGNORE INTO trip_tags (trip_id, tag) VALUES (?, ?)",
+                         [(trip.id, tag) for tag in trip.tags])
+        conn.execute("DELETE FROM attachments WHERE trip_id = ?", (trip.id,))
+        conn.executemany("INSERT OR IGNORE INTO attachments (trip_id, name, digest) VALUES (?, ?, ?)",
+                         [(trip.id, name, trip.blobs.get(name)) for name in trip.attachments])
+
+    def save_trip(self, trip: Trip, uploaded_files: List = []) -> bool:
+        """Saves a trip, streaming its uploads into the blob store."""
+        try:
+            new_attachments = []
+            for uploaded_file in uploaded_files:
+                digest, _ = self.blobs.put(uploaded_file)
+                trip.blobs[uploaded_file.name] = digest
+                if uploaded_file.name not in trip.attachments:
+                    new_attachments.append(uploaded_file.name)
+            trip.attachments = list(set(trip.attachments + new_attachments))
+
+            conn = self._connection()
+            with conn:
+                # Take the write lock before reading, so the version check and the write are one step
+                conn.execute("BEGIN IMMEDIATE")
+                previous = self.get_trip_by_id(trip.id)
+                check_version(trip, previous)
+                version, trip.version = trip.version, next_version(trip, previous)
+                try:
+                    self._write_trip(conn, trip)
+                except Exception:
+                    trip.version = version
+                    raise
+            self._writes += 1
+            self._publish(TripEvent(CHANGED if previous else ADDED, trip.id, trip, previous))
+            return True
+        except TripConflictError:
+            raise
+        except Exception as e:
+            logger.error(f"Error saving trip: {e}")
+            return False
+
+    def save_trips(self, trips: Iterable[Trip]) -> int:
+        """Saves a batch of trips in a single transaction."""
+        trips = list(trips)
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                previous = self._get_trips_by_id([trip.id for trip in trips])
+                for trip in trips:
+                    trip.version = next_version(trip, previous.get(trip.id))
+                    self._write_trip(conn, trip)
+            self._writes += 1
+            with self.aggregates.batch():
+                for trip in trips:
+                    old = previous.get(trip.id)
+                    self._publish(TripEvent(CHANGED if old else ADDED, trip.id, trip, old))
+            return len(trips)
+        except Exception as e:
+            logger.error(f"Error saving batch of {len(trips)} trips: {e}")
+            return 0
+
+    def delete_trip(self, trip_id: str, expected_version: Optional[int] = None) -> bool:
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                previous = self.get_trip_by_id(trip_id)
+                if previous is not None and expected_version is not None and previous.version != expected_version:
+                    raise TripConflictError(trip_id, expected_version, previous.version)
+                deleted = conn.execute("DELETE FROM trips WHERE id = ?", (trip_id,)).rowcount
+            self._writes += 1
+            if deleted:
+                self._publish(TripEvent(REMOVED, trip_id, None, previous))
+            return deleted > 0
+        except TripConflictError:
+            raise
+        except Exception as e:
+            logger.error(f"Error deleting trip {trip_id}: {e}")
+            return False
+
+    def get_trip_by_id(self, trip_id: str) -> Optional[Trip]:
+        row = self._connection().execute("SELECT data FROM trips WHERE id = ?", (trip_id,)).fetchone()
+        return Trip.from_dict(json.loads(row[0])) if row else None
+
+    def _get_trips_by_id(self, trip_ids: List[str]) -> Dict[str, Trip]:
+        found = {}
+        conn = self._connection()
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(trip_ids), 500):
+            chunk = trip_ids[i:i + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            for (data,) in conn.execute(f"SELECT data FROM trips WHERE id IN ({placeholders})", chunk):
+                trip = Trip.from_dict(json.loads(data))
+                found[trip.id] = trip
+        return found
+
+    def get_attachment_path(self, trip: Trip, filename: str) -> Path:
+        digest = trip.blobs.get(filename)
+        if digest:
+            return self.blobs.path_for(digest)
+        return self.base_path / trip.id / filename
+
+    def referenced_blobs(self) -> Set[str]:
+        rows = self._connection().execute("SELECT DISTINCT digest FROM attachments WHERE digest IS NOT NULL")
+        return {digest for (digest,) in rows}
+
+    def collect_garbage(self) -> int:
+        """Removes blobs no trip refers to, in this database or another store sharing .blobs/. Returns the number removed."""
+        others = shared_blob_references(self.base_path, self.db_path)
+        if others is None:
+            logger.warning("Not collecting blobs: another store in the same directory could not be read")
+            return 0
+        return self.blobs.collect_garbage(self.referenced_blobs() | others)
@@ -0,0 +1,81 @@
+from datetime import date
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .dates import DAY, MONTH
+from .intervals import FIRST, SPAN, TravelCalendar, merge_intervals, trip_intervals
+from .models import Trip
+
+EPOCH = pd.Timestamp("1970-01-01")
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _parse_dates(values: pd.Series) -> Tuple[pd.Series, pd.Series, pd.Series]:
+    """Vectorized parse of YYYY-MM-DD / YYYY-MM strings into (ordinal, precision, year)."""
+    is_day = values.str.len() == 10
+    # Month-precision dates become the 1st of the month so one strict format parses everything
+    parsed = pd.to_datetime(values.where(is_day, values + "-01"), format="%Y-%m-%d", errors="coerce")
+    ordinal = ((parsed - EPOCH).dt.days + EPOCH_ORDINAL).astype("Int64")
+    precision = pd.Categorical(np.where(is_day, DAY, MONTH), categories=[DAY, MONTH])
+    return ordinal, precision, parsed.dt.year.astype("Int64")
+
+
+def trips_to_frame(trips: List[Trip]) -> pd.DataFrame:
+    """Builds one row per trip with parsed start/end ordinals, precision and duration.
+
+    Dates that fail to parse are left as <NA> and such trips contribute no days.
+    """
+    frame = pd.DataFrame({
+        "id": [t.id for t in trips],
+        "country": pd.Series([t.country for t in trips], dtype="category"),
+        "city": [t.city for t in trips],
+        "start_date": pd.Series([t.start_date for t in trips], dtype="string"),
+        "end_date": pd.Series([t.end_date for t in trips], dtype="string"),
+    })
+    frame["start_ordinal"], frame["start_precision"], frame["year"] = _parse_dates(frame["start_date"])
+    frame["end_ordinal"], frame["end_precision"], _ = _parse_dates(frame["end_date"])
+    frame["days"] = (frame["end_ordinal"] - frame["start_ordinal"]).clip(lower=0)
+    return frame
+
+
+def _parsed(frame: pd.DataFrame) -> pd.DataFrame:
+    return frame.dropna(subset=["start_ordinal", "end_ordinal"])
+
+
+def summarize(frame: pd.DataFrame) -> Tuple[int, int, int]:
+    """Returns (total trips, distinct countries, total days traveled).
+
+    Days are nights away with overlapping or nested trips counted once.
+    """
+    parsed = _parsed(frame)
+    lo, hi = trip_intervals(parsed["start_ordinal"], parsed["end_ordinal"], False, FIRST, inclusive_end=False)
+    starts, ends = merge_intervals(lo, hi)
+    return len(frame), int(frame["country"].nunique()), int((ends - starts).sum())
+
+
+def travel_calendar(frame: pd.DataFrame, month_policy: str = SPAN, inclusive_end: bool = True) -> TravelCalendar:
+    """Builds a TravelCalendar from trips_to_frame output without re-parsing dates."""
+    parsed = _parsed(frame)
+    end_is_month = (parsed["end_precision"] == MONTH).to_numpy()
+    exact = ((parsed["start_precision"] == DAY) & (parsed["end_precision"] == DAY)).to_numpy()
+    lo, hi = trip_intervals(parsed["start_ordinal"], parsed["end_ordinal"], end_is_month, month_policy, inclusive_end)
+    return TravelCalendar(lo, hi, parsed["country"].astype(str).to_numpy(), exact)
+
+
+def per_year(frame: pd.DataFrame) -> pd.DataFrame:
+    """Trip count and days traveled per start year."""
+    return (
+        frame.dropna(subset=["year"])
+        .groupby("year")
+        .agg(trips=("id", "size"), days=("days", "sum"))
+        .sort_index()
+    )
+
+
+def per_country(frame: pd.DataFrame) -> pd.Series:
+    """Trip count per country, most visited first."""
+    counts = frame["country"].value_counts(sort=False)
+    counts = counts[counts > 0]
+    return counts.sort_values(ascending=False, kind="stable")
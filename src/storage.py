@@ -0,0 +1,212 @@
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Hashable, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+import logging
+from .models import Trip
+from .events import TripEvent, TripListener
+from .aggregates import TripAggregates, store_fingerprint
+from .layout import is_trip_folder_name
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+# Position in the start_date-descending order: (start_date, id) of the last trip seen
+Cursor = Tuple[str, str]
+
+
+@dataclass
+class TripPage:
+    trips: List[Trip]
+    total: int
+    offset: int
+    next_cursor: Optional[Cursor]
+
+
+class TripConflictError(Exception):
+    """Raised when a trip was changed or deleted by someone else since the version being saved."""
+
+    def __init__(self, trip_id: str, expected: int, actual: Optional[int]):
+        self.trip_id = trip_id
+        self.expected = expected
+        self.actual = actual  # None if the trip no longer exists
+        found = "it was deleted" if actual is None else f"found version {actual}"
+        super().__init__(f"Trip {trip_id} was modified concurrently: expected version {expected}, {found}")
+
+
+def check_version(trip: Trip, stored: Optional[Trip]):
+    """Raises TripConflictError unless trip was edited from the stored version (0 for a new trip)."""
+    actual = stored.version if stored is not None else None
+    if actual != trip.version and not (actual is None and trip.version == 0):
+        raise TripConflictError(trip.id, trip.version, actual)
+
+
+def next_version(trip: Trip, stored: Optional[Trip]) -> int:
+    return max(trip.version, stored.version if stored is not None else 0) + 1
+
+
+def page_offset(sort_keys: Sequence[Cursor], after: Optional[Cursor], offset: int) -> int:
+    """Turns a cursor into an offset into the descending order of ascending sort_keys."""
+    if after is None:
+        return offset
+    return len(sort_keys) - bisect_left(sort_keys, after)
+
+
+class TripStorage(ABC):
+    """Interface implemented by every trip storage backend.
+
+    Backends publish a TripEvent to subscribers after every successful
+    save or delete, so derived structures can update incrementally.
+
+    Trips carry a version that every save bumps. save_trip only writes a
+    trip whose version matches the stored one and raises TripConflictError
+    otherwise, so two people editing the same trip cannot silently
+    overwrite each other.
+    """
+
+    base_path: Path
+
+    def __init__(self):
+        self._listeners: List[TripListener] = []
+
+    def subscribe(self, listener: TripListener):
+        """Calls listener with a TripEvent after each change."""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: TripListener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _attach_aggregates(self, path: Path, flush_delay: float = 0.0):
+        """Loads (or first builds) the analytics aggregates at path and keeps them updated from change events."""
+        self.aggregates = TripAggregates(path, flush_delay)
+        # Trips changed while no process was running publish no events; compare against the store itself
+        if not self.aggregates.loaded or self.aggregates.fingerprint != self._store_fingerprint():
+            if self.aggregates.loaded:
+                logger.info(f"Aggregates at {path} are out of date, rebuilding")
+            self.aggregates.rebuild(self.scan_trips(use_cache=True))
+        self.subscribe(self.aggregates.handle_event)
+
+    def _store_fingerprint(self) -> int:
+        """store_fingerprint of every stored trip. Backends override this to avoid loading the trips."""
+        return store_fingerprint(self.iter_trips())
+
+    def _publish(self, event: TripEvent):
+        for listener in list(self._listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Trip listener {listener!r} failed on {event.kind} {event.trip_id}: {e}")
+
+    @abstractmethod
+    def scan_trips(self, use_cache: bool = False) -> List[Trip]:
+        """Returns all trips, newest start date first."""
+
+    @abstractmethod
+    def save_trip(self, trip: Trip, uploaded_files: List = []) -> bool:
+        """Creates or updates a trip and stores any uploaded attachments.
+
+        Sets trip.version to the version written. Raises TripConflictError if
+        the stored trip is not at trip.version; other failures return False.
+        """
+
+    def save_trips(self, trips: Iterable[Trip]) -> int:
+        """Saves a batch of trips without attachments. Returns how many were saved."""
+        return sum(1 for trip in trips if self.save_trip(trip))
+
+    @abstractmethod
+    def delete_trip(self, trip_id: str, expected_version: Optional[int] = None) -> bool:
+        """Deletes a trip. Returns False if it does not exist or deletion failed.
+
+        With expected_version, raises TripConflictError if the trip has been saved since.
+        """
+
+    @abstractmethod
+    def get_trip_by_id(self, trip_id: str) -> Optional[Trip]:
+        """Finds a trip by its unique ID."""
+
+    @abstractmethod
+    def get_attachment_path(self, trip: Trip, filename: str) -> Path:
+        """Returns the full path to an attachment."""
+
+    def open_attachment(self, trip: Trip, filename: str) -> BinaryIO:
+        """Opens an attachment for reading. Raises FileNotFoundError if it is missing."""
+        return open(self.get_attachment_path(trip, filename), "rb")
+
+    def attachment_key(self, trip: Trip, filename: str) -> Tuple[str, int, int]:
+        """(location, mtime, size) of an attachment, for caching its contents. Raises FileNotFoundError if it is missing."""
+        path = self.get_attachment_path(trip, filename)
+        st = path.stat()
+        return (str(path), st.st_mtime_ns, st.st_size)
+
+    @property
+    @abstractmethod
+    def generation(self) -> Hashable:
+        """A value that changes whenever a cached scan could return different trips."""
+
+    def query_page(self, limit: int = 20, offset: int = 0, after: Optional[Cursor] = None) -> TripPage:
+        """Returns one page of trips by start date descending.
+
+        Pages are addressed by offset, or by the cursor of the previous page
+        (after), which stays stable while trips are added or removed.
+        """
+        trips = self.scan_trips(use_cache=True)
+        trips.sort(key=lambda x: (x.start_date, x.id), reverse=True)
+        keys = [(t.start_date, t.id) for t in reversed(trips)]
+        start = page_offset(keys, after, offset)
+        page = trips[start:start + limit]
+        next_cursor = (page[-1].start_date, page[-1].id) if start + limit < len(trips) and page else None
+        return TripPage(page, len(trips), start, next_cursor)
+
+    def iter_trips(self) -> Iterator[Trip]:
+        """Yields every trip, in no particular order."""
+        yield from self.scan_trips()
+
+
+def open_storage(location: str, **kwargs) -> TripStorage:
+    """Opens the backend for a location: a SQLite file (.db/.sqlite) or a trips_data directory."""
+    if str(location).endswith(SQLITE_SUFFIXES):
+        from .sqlite_store import SQLiteTripManager
+        return SQLiteTripManager(location)
+    from .manager import TripManager
+    return TripManager(location, **kwargs)
+
+
+def shared_blob_references(base_path: Path, exclude: Path) -> Optional[Set[str]]:
+    """Digests referenced by the other stores in base_path, which share its .blobs/ directory.
+
+    exclude is the store asking (its database file, or base_path for the
+    folder store). Returns None if one of the stores cannot be read, in
+    which case no blob may be collected.
+    """
+    base_path = Path(base_path)
+    referenced: Set[str] = set()
+    for path in base_path.iterdir():
+        if path == exclude:
+            continue
+        if path.is_file() and path.name.endswith(SQLITE_SUFFIXES):
+            try:
+                conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+                try:
+                    rows = conn.execute("SELECT DISTINCT digest FROM attachments WHERE digest IS NOT NULL").fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Cannot read the blob references of {path}: {e}")
+                return None
+            referenced.update(digest for (digest,) in rows)
+        elif exclude != base_path and is_trip_folder_name(path.name):
+            # Read the folder store's metadata directly; opening a TripManager would index and write to it
+            try:
+                with open(path / "metadata.json", "r") as f:
+                    referenced.update(json.load(f).get("blobs", {}).values())
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            except Exception as e:
+                logger.warning(f"Cannot read the blob references of {path}: {e}")
+                return None
+    return referenced
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from threading import Lock
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+import logging
+from . import instrumentation
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIRNAME = ".thumbnails"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+def is_image(filename: str) -> bool:
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+class ThumbnailCache:
+    """Downscaled JPEG copies of attachment photos, created once and reused.
+
+    Thumbnails are named <sha256 of the source>_<size>.jpg, so the same photo
+    attached to several trips shares one thumbnail. A thumbnail's mtime is
+    bumped whenever it is served, and the least recently used ones are
+    deleted once the directory grows past max_bytes.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = 64 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self._lock = Lock()
+
+    def _digest(self, source: Path, opener: Optional[Callable[[], BinaryIO]],
+                key: Optional[Tuple[str, int, int]]) -> str:
+        if key is None and opener is None:
+            st = source.stat()
+            key = (str(source), st.st_mtime_ns, st.st_size)
+        digest = self._digests.get(key)
+        if digest is None:
+            hasher = hashlib.sha256()
+            with opener() if opener else open(source, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+            if key is not None:
+                self._digests[key] = digest
+        return digest
+
+    def get(self, source: Path, size: int = 480, digest: Optional[str] = None,
+            opener: Optional[Callable[[], BinaryIO]] = None, key: Optional[Tuple[str, int, int]] = None) -> Path:
+        """Returns a thumbnail of source no larger than size x size pixels.
+
+        digest may be passed when the content hash is already known (blob
+        store attachments), which skips hashing the source. opener, if given,
+        reads the image instead of source (attachments of archived trips);
+        pass its attachment_key as key so its hash is computed only once.
+        Falls back to source if Pillow is unavailable or the image is unreadable.
+        """
+        source = Path(source)
+        thumb_path = self.root / f"{digest or self._digest(source, opener, key)}_{size}.jpg"
+        if thumb_path.exists():
+            os.utime(thumb_path)
+            instrumentation.count("thumbnails.hits")
+            return thumb_path
+
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            return source
+
+        with self._lock, instrumentation.span("thumbnails.render"):
+            tmp_name = None
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                with opener() if opener else open(source, "rb") as f, Image.open(f) as image:
+                    image = ImageOps.exif_transpose(image)
+                    image.thumbnail((size, size))
+                    fd, tmp_name = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+                    with os.fdopen(fd, "wb") as out:
+                        image.convert("RGB").save(out, "JPEG", quality=85)
+                os.replace(tmp_name, thumb_path)
+            except Exception as e:
+                logger.warning(f"Failed to create thumbnail for {source}: {e}")
+                if tmp_name is not None and os.path.exists(tmp_name):
+                    os.unlink(tmp_name)
+                return source
+            self._evict()
+        return thumb_path
+
+    def _evict(self):
+        thumbs = [(p.stat(), p) for p in self.root.glob("*.jpg")]
+        total = sum(st.st_size for st, _ in thumbs)
+        if total <= self.max_bytes:
+            return
+        thumbs.sort(key=lambda item: item[0].st_mtime_ns)
+        for st, path in thumbs:
+            if total <= self.max_bytes:
+                break
+            path.unlink()
+            total -= st.st_size
@@ -0,0 +1,178 @@
+"""Bulk import and export of trips as NDJSON or CSV.
+
+    python -m src.transfer import history.ndjson --into trips_data
+    python -m src.transfer import history.csv --into trips_data/trips.db --batch-size 1000
+    python -m src.transfer export backup.ndjson --from trips_data
+
+Records are streamed one at a time in both directions, so neither command
+holds the whole catalog in memory. CSV files use the columns in CSV_FIELDS,
+with tags and attachments separated by ";" and blobs (attachment name ->
+blob digest) as a JSON object.
+"""
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+import uuid
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from .dates import parse_trip_date
+from .models import Trip
+from .storage import TripStorage, open_storage
+
+logger = logging.getLogger(__name__)
+
+CSV_FIELDS = ["id", "start_date", "end_date", "city", "country", "notes", "tags", "attachments", "blobs", "version"]
+LIST_SEPARATOR = ";"
+
+
+def _detect_format(path: str, fmt: str) -> str:
+    if fmt != "auto":
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def read_records(f, fmt: str, on_invalid: Optional[Callable[[int, Exception], None]] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yields (line number, raw record) pairs from an NDJSON or CSV stream.
+
+    NDJSON lines that are not valid JSON are passed to on_invalid and
+    skipped; without on_invalid the JSONDecodeError is raised.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            for field in ("tags", "attachments"):
+                value = row.get(field) or ""
+                row[field] = [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()]
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                if on_invalid is None:
+                    raise
+                on_invalid(line_num, e)
+                continue
+            yield line_num, record
+
+
+def record_to_trip(record: Dict[str, Any]) -> Trip:
+    """Validates a raw record and turns it into a Trip. Raises ValueError/KeyError if invalid."""
+    if not isinstance(record, dict):
+        raise ValueError(f"expected an object, got {type(record).__name__}")
+    record = dict(record)
+    if not record.get("id"):
+        record["id"] = str(uuid.uuid4())
+    if isinstance(record.get("blobs"), str):  # CSV cells
+        record["blobs"] = json.loads(record["blobs"] or "{}")
+    if isinstance(record.get("version"), str):
+        record["version"] = int(record["version"] or 0)
+    trip = Trip.from_dict(record)
+    parse_trip_date(trip.start_date)
+    parse_trip_date(trip.end_date)
+    if not trip.city or not trip.country:
+        raise ValueError("city and country are required")
+    return trip
+
+
+def _batched(items: Iterable[Trip], size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_trips(storage: TripStorage, f, fmt: str = "ndjson", batch_size: int = 500) -> Dict[str, float]:
+    """Streams records from f into storage in batches. Returns counts and throughput."""
+    stats = {"read": 0, "invalid": 0, "saved": 0}
+
+    def skip(line_num: int, error: Exception):
+        stats["invalid"] += 1
+        logger.warning(f"Skipping invalid record on line {line_num}: {error}")
+
+    def unparsable(line_num: int, error: Exception):
+        stats["read"] += 1
+        skip(line_num, error)
+
+    def valid_trips() -> Iterator[Trip]:
+        for line_num, record in read_records(f, fmt, on_invalid=unparsable):
+            stats["read"] += 1
+            try:
+                yield record_to_trip(record)
+            except (ValueError, KeyError, TypeError) as e:
+                skip(line_num, e)
+
+    start = time.perf_counter()
+    for batch in _batched(valid_trips(), batch_size):
+        stats["saved"] += storage.save_trips(batch)
+        logger.info(f"Imported {stats['saved']} trips")
+    stats["seconds"] = time.perf_counter() - start
+    stats["trips_per_second"] = stats["saved"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def export_trips(storage: TripStorage, f, fmt: str = "ndjson") -> Dict[str, float]:
+    """Streams every trip in storage to f. Returns counts and throughput."""
+    start = time.perf_counter()
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+    for trip in storage.iter_trips():
+        if fmt == "csv":
+            row = trip.to_dict()
+            row["tags"] = LIST_SEPARATOR.join(trip.tags)
+            row["attachments"] = LIST_SEPARATOR.join(trip.attachments)
+            row["blobs"] = json.dumps(trip.blobs)
+            writer.writerow({field: row[field] for field in CSV_FIELDS})
+        else:
+            f.write(json.dumps(trip.to_dict()) + "\n")
+        count += 1
+    seconds = time.perf_counter() - start
+    return {"exported": count, "seconds": seconds, "trips_per_second": count / seconds if seconds else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import and export of trips as NDJSON or CSV.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Load trips from a file ('-' for stdin)")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--into", required=True, help="trips_data directory or SQLite file")
+    import_parser.add_argument("--format", choices=["auto", "ndjson", "csv"], default="auto")
+    import_parser.add_argument("--batch-size", type=int, default=500)
+
+    export_parser = commands.add_parser("export", help="Write all trips to a file ('-' for stdout)")
+    export_parser.add_argument("file")
+    export_parser.add_argument("--from", dest="source", required=True, help="trips_data directory or SQLite file")
+    export_parser.add_argument("--format", choices=["auto", "ndjson", "csv"], default="auto")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    fmt = _detect_format(args.file, args.format)
+
+    if args.command == "import":
+        storage = open_storage(args.into)
+        f = sys.stdin if args.file == "-" else open(args.file, "r", newline="")
+        with f:
+            stats = import_trips(storage, f, fmt, args.batch_size)
+        print(f"Imported {stats['saved']} of {stats['read']} records ({stats['invalid']} invalid) "
+              f"in {stats['seconds']:.2f}s, {stats['trips_per_second']:.0f} trips/s", file=sys.stderr)
+    else:
+        storage = open_storage(args.source)
+        f = sys.stdout if args.file == "-" else open(args.file, "w", newline="")
+        with f:
+            stats = export_trips(storage, f, fmt)
+        print(f"Exported {stats['exported']} trips in {stats['seconds']:.2f}s, "
+              f"{stats['trips_per_second']:.0f} trips/s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+from typing import Dict, Optional, Set
+import logging
+from .layout import is_trip_folder_name
+from .manager import TripManager
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+BASE_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+FOLDER_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Minimal ctypes binding for Linux inotify."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Yields (wd, mask, name) for everything currently queued."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += length
+            yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+class TripWatcher:
+    """Background thread that turns outside changes to a TripManager's folder into TripEvents.
+
+    Uses inotify on Linux (one watch on the data directory plus one per trip
+    folder) and falls back to polling, i.e. a stat of every metadata.json
+    every poll_interval seconds, elsewhere or when inotify is unavailable or
+    out of watches. Changed folders are passed to TripManager.sync_folder,
+    which updates only the affected cache and index entries and publishes
+    added/changed/removed events. While running, cached scans skip their
+    own stat pass.
+    """
+
+    def __init__(self, manager: TripManager, poll_interval: float = 2.0, use_inotify: Optional[bool] = None):
+        self.manager = manager
+        self.poll_interval = poll_interval
+        self.use_inotify = sys.platform.startswith("linux") if use_inotify is None else use_inotify
+        self.mode: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        # Prime the cache so later events have a previous state to diff against
+        self.manager.scan_trips(use_cache=True)
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify()
+                watches = self._watch_all(inotify)
+            except OSError as e:
+                logger.warning(f"inotify unavailable ({e}), polling {self.manager.base_path} instead")
+                if inotify is not None:
+                    inotify.close()
+                inotify = None
+        self._stop.clear()
+        try:
+            os.read(self._wake_r, 1024)  # drain a wake-up left over from a previous stop()
+        except BlockingIOError:
+            pass
+        if inotify is not None:
+            self.mode = "inotify"
+            target, args = self._run_inotify, (inotify, watches)
+        else:
+            self.mode = "polling"
+            target, args = self._run_polling, ()
+        self._thread = threading.Thread(target=target, args=args, name="TripWatcher", daemon=True)
+        self._thread.start()
+        self.manager.watching = True
+
+    def stop(self):
+        self.manager.watching = False
+        self._stop.set()
+        os.write(self._wake_w, b"x")
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch_all(self, inotify: _Inotify) -> Dict[int, Optional[str]]:
+        """Adds watches for the data directory and every trip folder. Maps wd -> folder (None for the base)."""
+        base = str(self.manager.base_path)
+        watches = {inotify.add_watch(base, BASE_MASK): None}
+        for entry in os.scandir(base):
+            if entry.is_dir() and is_trip_folder_name(entry.name):
+                watches[inotify.add_watch(entry.path, FOLDER_MASK)] = entry.name
+        return watches
+
+    def _sync(self, folders: Set[str]):
+        for folder_name in sorted(folders):
+            try:
+                self.manager.sync_folder(folder_name)
+            except Exception as e:
+                logger.error(f"Failed to sync trip folder {folder_name}: {e}")
+
+    def _run_inotify(self, inotify: _Inotify, watches: Dict[int, Optional[str]]):
+        base = self.manager.base_path
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([inotify.fd, self._wake_r], [], [])
+                if self._wake_r in ready:
+                    break
+
+                changed: Set[str] = set()
+                overflow = False
+                for wd, mask, name in inotify.read_events():
+                    if mask & IN_Q_OVERFLOW:
+                        overflow = True
+                        continue
+                    if mask & IN_IGNORED:
+                        watches.pop(wd, None)
+                        continue
+                    folder = watches.get(wd, "")
+                    if folder is None:
+                        # Event on the data directory itself: a trip folder appeared or went away
+                        if not is_trip_folder_name(name) or not mask & IN_ISDIR:
+                            continue
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            try:
+                                watches[inotify.add_watch(str(base / name), FOLDER_MASK)] = name
+                            except OSError as e:
+                                logger.warning(f"Cannot watch {name} ({e}); falling back to polling")
+                                self.mode = "polling"
+                                self._run_polling()
+                                return
+                        changed.add(name)
+                    elif folder and name == "metadata.json":
+                        changed.add(folder)
+
+                if overflow:
+                    logger.warning("inotify queue overflowed, resyncing every trip folder")
+                    self.manager.sync_all()
+                else:
+                    self._sync(changed)
+        finally:
+            inotify.close()
+
+    def _run_polling(self):
+        while not self._stop.is_set():
+            try:
+                self.manager.sync_all()
+            except Exception as e:
+                logger.error(f"Polling {self.manager.base_path} failed: {e}")
+            self._stop.wait(self.poll_interval)